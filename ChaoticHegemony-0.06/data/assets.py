@@ -0,0 +1,160 @@
+"""Module: assets.py
+Overview: Image loading from a packed asset bundle.  Run this module
+(python -m data.assets) to build the bundle; it stores every image already
+decoded to raw pixels, pre-scaled variants and colorkey/alpha flags in one
+file.  At run time the bundle is memory mapped and surfaces are only
+made the first time a name is looked up.  If the bundle is missing or older
+than the images it was built from, images are decoded from disk as before.
+Classes: Bundle, Graphics
+Functions: open_bundle(path=BUNDLE), build(path=BUNDLE)"""
+
+import json,mmap,os,struct,threading
+import pygame as pg
+
+ROOT   = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLE = os.path.join(ROOT,"assets.bundle")
+MAGIC  = b"KHBUNDL1"
+COLORKEY = (255,0,255)
+
+#Image directories and whether they use per pixel alpha (otherwise colorkey).
+SOURCES  = (("graphics",False),("graphalpha",True))
+#Scaled copies worth building ahead of time; name -> list of sizes.
+VARIANTS = {"myneb1":[(1500,900)]}
+
+class Bundle:
+    """Read only view of a bundle file.  The header is a JSON index of
+    name -> record; pixel data follows it.  Surfaces made by surface() share
+    memory with the mapping, so the Bundle must outlive them."""
+    def __init__(self,path):
+        with open(path,"rb") as bundle:
+            self.map = mmap.mmap(bundle.fileno(),0,access=mmap.ACCESS_COPY)
+        if self.map[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not an asset bundle: {}".format(path))
+        length = struct.unpack_from("<I",self.map,len(MAGIC))[0]
+        start = len(MAGIC)+4
+        header = json.loads(self.map[start:start+length].decode("utf-8"))
+        self.base = start+length
+        self.index = header["images"]
+        self.sources = header["sources"]
+
+    def __contains__(self,name):
+        return name in self.index
+
+    def fresh(self):
+        """True if no source image has changed since the bundle was built."""
+        return self.sources == stat_sources()
+
+    def surface(self,name):
+        """Surface for name straight out of the mapped pixel data."""
+        record = self.index[name]
+        start = self.base+record["offset"]
+        data = memoryview(self.map)[start:start+record["length"]]
+        image = pg.image.frombuffer(data,record["size"],record["format"])
+        if record["colorkey"]:
+            image.set_colorkey(record["colorkey"])
+        return image
+
+class Graphics(dict):
+    """Dictionary of the images in a directory keyed by name minus extension.
+    Images are loaded on first access; from the bundle if there is a fresh
+    one, otherwise by decoding the file.  prepare converts a surface for the
+    display."""
+    def __init__(self,directory,alpha,bundle,prepare):
+        dict.__init__(self)
+        self.directory = os.path.join(ROOT,directory)
+        self.alpha = alpha
+        self.bundle = bundle
+        self.prepare = prepare
+        self.files = {graf[:-4]:graf for graf in os.listdir(self.directory)
+                      if graf[-3:] in ("png","jpg")}
+        self.lock = threading.RLock()
+
+    def __contains__(self,name):
+        return name in self.files
+
+    def __missing__(self,name):
+        with self.lock:
+            if dict.__contains__(self,name): #Loaded by another thread meanwhile.
+                return dict.__getitem__(self,name)
+            if self.bundle and name in self.bundle:
+                image = self.prepare(self.bundle.surface(name),self.alpha)
+            else:
+                image = self.prepare(decode(self.directory,self.files[name],self.alpha),self.alpha)
+            if not self.alpha:
+                image.set_colorkey(COLORKEY)
+            self[name] = image
+            return image
+
+    def scaled(self,name,size):
+        """A scaled copy of an image, pre-built in the bundle when possible."""
+        key = "{}@{}x{}".format(name,*size)
+        if not dict.__contains__(self,key):
+            with self.lock:
+                if not dict.__contains__(self,key):
+                    if self.bundle and key in self.bundle:
+                        image = self.prepare(self.bundle.surface(key),self.alpha)
+                        if not self.alpha:
+                            image.set_colorkey(COLORKEY)
+                    else:
+                        image = pg.transform.scale(self[name],size)
+                    self[key] = image
+        return dict.__getitem__(self,key)
+
+def decode(directory,graf,alpha):
+    image = pg.image.load(os.path.join(directory,graf))
+    if not alpha:
+        image.set_colorkey(COLORKEY)
+    return image
+
+def stat_sources():
+    """Size and modification time of every source image."""
+    stats = {}
+    for directory,alpha in SOURCES:
+        for graf in sorted(os.listdir(os.path.join(ROOT,directory))):
+            if graf[-3:] in ("png","jpg"):
+                info = os.stat(os.path.join(ROOT,directory,graf))
+                stats["/".join((directory,graf))] = [info.st_size,info.st_mtime_ns]
+    return stats
+
+def open_bundle(path=BUNDLE):
+    """The bundle at path, or None if there isn't a usable, up to date one."""
+    try:
+        bundle = Bundle(path)
+    except (IOError,OSError,ValueError):
+        return None
+    return bundle if bundle.fresh() else None
+
+def build(path=BUNDLE):
+    """Decode every image and write the bundle.  Colorkey images are stored as
+    RGBX and alpha images as RGBA, 32 bits per pixel like the display."""
+    index,blobs,offset = {},[],0
+    def add(name,image,alpha):
+        nonlocal offset
+        fmt = "RGBA" if alpha else "RGBX"
+        pixels = pg.image.tostring(image,fmt)
+        if not alpha:
+            #The padding byte must be 0 or no pixel ever equals the colorkey.
+            pixels = bytearray(pixels)
+            pixels[3::4] = bytes(len(pixels)//4)
+            pixels = bytes(pixels)
+        index[name] = {"size":list(image.get_size()),"format":fmt,"offset":offset,
+                       "length":len(pixels),"colorkey":None if alpha else list(COLORKEY)}
+        blobs.append(pixels)
+        offset += len(pixels)
+    for directory,alpha in SOURCES:
+        for graf in sorted(os.listdir(os.path.join(ROOT,directory))):
+            if graf[-3:] in ("png","jpg"):
+                image = decode(os.path.join(ROOT,directory),graf,alpha)
+                add(graf[:-4],image,alpha)
+                for size in VARIANTS.get(graf[:-4],()):
+                    add("{}@{}x{}".format(graf[:-4],*size),pg.transform.scale(image,size),alpha)
+    header = json.dumps({"images":index,"sources":stat_sources()}).encode("utf-8")
+    with open(path,"wb") as bundle:
+        bundle.write(MAGIC+struct.pack("<I",len(header))+header)
+        for blob in blobs:
+            bundle.write(blob)
+    return path
+
+if __name__ == "__main__":
+    pg.init()
+    print("Wrote {}".format(build()))
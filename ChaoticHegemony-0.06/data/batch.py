@@ -0,0 +1,153 @@
+"""Module: batch.py
+Overview: Headless batch runner for balance tuning.  Plays many fights across
+a multiprocessing pool with scripted or random pilots, sweeping a grid of ship
+attribute values, and writes win rates, time to kill and damage figures to a
+JSON results file.  --step N simulates N ticks of game time per step, which
+swept collisions (see sweep.py) keep correct, for N times fewer steps per
+match; times are still reported in ticks.  Run from the game directory, eg.
+    python -m data.batch --matches 200 --sweep P1.accel=0.04,0.05,0.06
+Functions: random_policy, chase_policy, ai_policy, play_match(job),
+           make_grid(sweeps), summarize(stats,results), run_sweep(...), main(argv=None)"""
+
+import os
+os.environ.setdefault("HEGEMONY_HEADLESS","1") #Must happen before globs is imported.
+
+import argparse,itertools,json,math,multiprocessing,random,time
+
+from . import fight,pilot,simclock
+
+def random_policy(ship,enemy,rng):
+    """Mash random controls, holding each choice for about a third of a second."""
+    if rng.random() < 0.05*(ship.clock.step/simclock.TICK):
+        ship.left,ship.right,ship.thrust,ship.reverse,ship.go_prime = [
+            rng.random() < chance for chance in (0.3,0.3,0.6,0.1,0.6)]
+
+def chase_policy(ship,enemy,rng):
+    """Turn toward the enemy, close in, and fire when roughly lined up.
+    A little noise keeps matches from being identical."""
+    dx = enemy.location[0]-ship.location[0]
+    dy = enemy.location[1]-ship.location[1]
+    error = (math.degrees(math.atan2(dy,dx))-ship.calc_angle+180)%360-180
+    dt = ship.clock.step/simclock.TICK #Ticks of game time per step.
+    if rng.random() < 0.1*dt:
+        error += rng.uniform(-90,90)
+    ship.right = error > ship.rot_speed*dt/2.0
+    ship.left  = error < -ship.rot_speed*dt/2.0
+    ship.thrust = math.hypot(dx,dy) > 120
+    ship.reverse = False
+    ship.go_prime = abs(error) < 15
+
+def ai_policy(ship,enemy,rng):
+    """Hand the ship to a computer pilot, which the fight then flies.  No time
+    budget, so matches stay repeatable."""
+    if not ship.ai:
+        ship.ai = pilot.Pilot(budget=None)
+
+POLICIES = {"random":random_policy,"chase":chase_policy,"ai":ai_policy}
+
+def play_match(job):
+    """Play a single headless fight.  job is (point,stats,policies,seed,max_ticks,step)
+    and the result is (point,winner,ticks to kill,damage to P1,damage to P2,shots)
+    where winner is 1, 2, 0 for mutual destruction or -1 if time ran out."""
+    point,stats,pilots,seed,max_ticks,step = job
+    rng = random.Random(seed)
+    Fighter = fight.Fight(simclock.SimClock(simclock.TICK*step),stats)
+    Fighter.set_up()
+    ships = Fighter.Players
+    brains = [POLICIES[name] for name in pilots]
+    kill = shots = 0
+    while Fighter.clock.ticks*step < max_ticks and not Fighter.victory:
+        for ship,enemy,brain in zip(ships,ships[::-1],brains):
+            if not ship.sleep:
+                brain(ship,enemy,rng)
+        before = len(Fighter.Shots)
+        Fighter.update(None)
+        shots += max(len(Fighter.Shots)-before,0)
+        if not kill and any(ship.life <= 0 for ship in ships):
+            kill = Fighter.clock.ticks*step
+    winner = {"ONE":1,"TWO":2,"BOTH":0}.get(Fighter.victory,-1)
+    damage = [min(ship.max_life-ship.life,ship.max_life) for ship in ships]
+    return point,winner,kill,damage[0],damage[1],shots
+
+def make_grid(sweeps):
+    """Expand {"P1.accel":[...],"P2.regen":[...]} into a list of per-player
+    stat override pairs, one per combination of values."""
+    names = sorted(sweeps)
+    grid = []
+    for values in itertools.product(*[sweeps[name] for name in names]):
+        stats = ({},{})
+        for name,value in zip(names,values):
+            player,attr = name.split(".")
+            stats[{"P1":0,"P2":1}[player]][attr] = value
+        grid.append(stats)
+    return grid
+
+def quantiles(values,points=(0.1,0.5,0.9)):
+    values = sorted(values)
+    if not values:
+        return []
+    return [values[min(int(q*len(values)),len(values)-1)] for q in points]
+
+def summarize(stats,results):
+    """Reduce the results of the matches played at one grid point."""
+    matches = len(results)
+    winners = [result[1] for result in results]
+    kills = [result[2] for result in results if result[2]]
+    return {"P1":stats[0],"P2":stats[1],"matches":matches,
+            "win_rate":{label:winners.count(code)/float(matches)
+                        for label,code in (("P1",1),("P2",2),("both",0),("timeout",-1))},
+            "ticks_to_kill":{"mean":sum(kills)/float(len(kills)) if kills else None,
+                             "p10_p50_p90":quantiles(kills)},
+            "damage_taken":{"P1":quantiles([result[3] for result in results]),
+                            "P2":quantiles([result[4] for result in results])},
+            "shots_per_match":sum(result[5] for result in results)/float(matches),
+            "raw":[list(result[1:]) for result in results]}
+
+def run_sweep(sweeps,matches=100,pilots=("chase","chase"),max_ticks=64*60,
+              workers=None,seed=0,step=1):
+    """Play matches fights at every point of the sweep grid spread over a
+    process pool, returning one summary per grid point."""
+    grid = make_grid(sweeps)
+    jobs = [(point,stats,pilots,seed*1000003+point*matches+match,max_ticks,step)
+            for point,stats in enumerate(grid) for match in range(matches)]
+    results = [[] for stats in grid]
+    workers = workers or multiprocessing.cpu_count()
+    chunk = max(1,len(jobs)//(workers*8))
+    pool = multiprocessing.Pool(workers)
+    for result in pool.imap_unordered(play_match,jobs,chunk):
+        results[result[0]].append(result)
+    pool.close()
+    pool.join()
+    for group in results:
+        group.sort(key=lambda result:result[1:])
+    return [summarize(stats,group) for stats,group in zip(grid,results)]
+
+def parse_sweep(text):
+    """'P1.accel=0.04,0.05' -> ('P1.accel',[0.04,0.05])"""
+    name,values = text.split("=")
+    return name,[json.loads(value) for value in values.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless balance sweeps.")
+    parser.add_argument("--sweep",action="append",default=[],type=parse_sweep,
+                        help="NAME=V1,V2,... where NAME is P1.attr or P2.attr")
+    parser.add_argument("--matches",type=int,default=100,help="fights per grid point")
+    parser.add_argument("--ticks",type=int,default=64*60,help="tick limit per fight")
+    parser.add_argument("--step",type=int,default=1,help="ticks of game time per simulation step")
+    parser.add_argument("--pilots",nargs=2,default=["chase","chase"],choices=sorted(POLICIES))
+    parser.add_argument("--workers",type=int,default=None)
+    parser.add_argument("--seed",type=int,default=0)
+    parser.add_argument("--out",default="balance.json")
+    args = parser.parse_args(argv)
+    begin = time.time()
+    summary = run_sweep(dict(args.sweep),args.matches,args.pilots,args.ticks,
+                        args.workers,args.seed,args.step)
+    with open(args.out,"w") as results:
+        json.dump({"pilots":args.pilots,"ticks":args.ticks,"step":args.step,"seed":args.seed,
+                   "points":summary},results,separators=(",",":"))
+    for point in summary:
+        print(point["P1"],point["P2"],point["win_rate"])
+    print("%d matches in %.1fs" % (len(summary)*args.matches,time.time()-begin))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Module: bench.py
+Overview: Scripted performance benchmarks.  Each scenario sets up a fight,
+drives it the same way every run, and draws every frame to a window that is
+never shown (SDL's dummy video driver).  Frame times, mask tests, surfaces made
+by the caches and growth in allocated memory blocks are reported, and compared
+against a stored baseline so that slowdowns fail.  Run from the game directory:
+    python -m data.bench                 compare with bench_baseline.json
+    python -m data.bench --save          record a new baseline
+Timings depend on the machine, so record the baseline on the machine that
+runs the comparison.
+Functions: run_scenario(name,frames), compare(results,baseline,...),
+           main(argv=None)"""
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER","dummy") #Must happen before globs is imported.
+os.environ.setdefault("SDL_AUDIODRIVER","dummy")
+
+import argparse,json,random,sys,time
+
+from . import fight,simclock
+from .globs import *
+from .profiler import PROFILE,percentile
+from .render import DIRTY
+
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "bench_baseline.json")
+
+def place(Fighter,loc1,loc2):
+    """Park both ships at fixed locations."""
+    for Player,loc in zip(Fighter.Players,(loc1,loc2)):
+        Player.location = list(loc)
+        Player.vel_x = Player.vel_y = 0.0
+
+def idle_setup(Fighter,rng):
+    place(Fighter,(100,100),(700,500))
+
+def idle_frame(Fighter,frame,rng):
+    pass
+
+def turning_setup(Fighter,rng):
+    place(Fighter,(370,280),(440,320))
+
+def turning_frame(Fighter,frame,rng):
+    Fighter.P1.left = Fighter.P2.right = True
+
+def shots_setup(Fighter,rng):
+    place(Fighter,(100,100),(700,500))
+
+def shots_frame(Fighter,frame,rng,live=500):
+    """Keep live shots from both ships flying in random directions.  They do
+    no damage so the ships survive."""
+    Shots = Fighter.Shots
+    while len(Shots) < live:
+        side = len(Shots)%2
+        Shots.add(Fighter.Players[side],GFXA[("blue_pulse","tri_pulse")[side]],1000,0)
+        Shots.vel[len(Shots)-1] = (rng.uniform(-3,3),rng.uniform(-3,3))
+
+def zoom_setup(Fighter,rng):
+    place(Fighter,(400,300),(400,300))
+
+def zoom_frame(Fighter,frame,rng,period=48):
+    """Move P2 back and forth past both zoom thresholds."""
+    phase = abs(frame%(2*period)-period)/float(period)
+    place(Fighter,(150,150),(170+phase*550,170+phase*350))
+
+def death_setup(Fighter,rng):
+    place(Fighter,(300,250),(450,350))
+    Fighter.P1.life = 0
+
+def melee_setup(Fighter,rng):
+    for Player in Fighter.Players:
+        Player.ai = None #Scripted instead, so every run is the same.
+
+def melee_frame(Fighter,frame,rng,period=32):
+    """Every ship picks new turn and thrust controls now and then, so they
+    spread out and close in and the smooth camera zooms back and forth."""
+    if not frame%period:
+        for Player in Fighter.Players:
+            Player.left,Player.right = rng.random() < 0.3,rng.random() < 0.3
+            Player.thrust = rng.random() < 0.6
+
+SCENARIOS = {"idle_zoom4"   :(idle_setup,idle_frame),
+             "turning_zoom1":(turning_setup,turning_frame),
+             "shots_500"    :(shots_setup,shots_frame),
+             "zoom_cycle"   :(zoom_setup,zoom_frame),
+             "death"        :(death_setup,idle_frame),
+             "melee_8"      :(melee_setup,melee_frame)}
+#Ships in the scenarios with more than two.
+CROWDS = {"melee_8":8}
+
+def play(name,frames,seed=0):
+    """Play one scenario from a fresh fight, returning frame times in ms and
+    how many more memory blocks were allocated at the end than at the start."""
+    setup,per_frame = SCENARIOS[name]
+    rng = random.Random(seed)
+    Fighter = fight.Fight(simclock.SimClock(),ships=fight.lineup(CROWDS.get(name,2)))
+    Fighter.set_up()
+    setup(Fighter,rng)
+    DIRTY.invalidate()
+    times = [0.0]*frames
+    blocks = sys.getallocatedblocks()
+    for frame in range(frames):
+        per_frame(Fighter,frame,rng)
+        start = time.perf_counter()
+        Fighter.update(SURFACE)
+        DIRTY.flush()
+        times[frame] = (time.perf_counter()-start)*1000.0
+        PROFILE.frame()
+    return times,sys.getallocatedblocks()-blocks
+
+def run_scenario(name,frames=300,seed=0):
+    """Play a scenario three times; to warm the caches, to time frames and
+    count memory blocks, and with the profiler on to collect its counters."""
+    play(name,frames,seed)
+    times,blocks = play(name,frames,seed)
+    enabled,size = PROFILE.enabled,PROFILE.size
+    PROFILE.enabled,PROFILE.size = True,frames
+    PROFILE.clear()
+    play(name,frames,seed)
+    counters = {name:list(samples) for name,samples in PROFILE.counters.items()}
+    PROFILE.enabled,PROFILE.size = enabled,size
+    PROFILE.clear()
+    return {"frames":frames,
+            "ms":{"mean":sum(times)/len(times),"p50":percentile(times,50),
+                  "p90":percentile(times,90),"p99":percentile(times,99),"max":max(times)},
+            "mask_tests":sum(counters.get("mask tests",[0]))/float(frames),
+            "surfaces":sum(counters.get("surfaces",[0])),
+            "blocks":blocks}
+
+def compare(results,baseline,ratio=1.3,slack=0.1):
+    """List of failure messages; a timing fails if it is more than ratio times
+    its baseline plus slack ms, a count if it is more than ratio times its
+    baseline plus one."""
+    failures = []
+    for name,result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        for key in ("p50","p90"):
+            if result["ms"][key] > base["ms"][key]*ratio+slack:
+                failures.append("{} {}: {:.3f}ms > baseline {:.3f}ms".format(
+                                name,key,result["ms"][key],base["ms"][key]))
+        for key in ("mask_tests","surfaces"):
+            if result[key] > base[key]*ratio+1:
+                failures.append("{} {}: {} > baseline {}".format(name,key,result[key],base[key]))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frame time benchmarks.")
+    parser.add_argument("scenarios",nargs="*",default=sorted(SCENARIOS),
+                        help="any of: "+", ".join(sorted(SCENARIOS)))
+    parser.add_argument("--frames",type=int,default=300)
+    parser.add_argument("--baseline",default=BASELINE)
+    parser.add_argument("--save",action="store_true",help="write results as the new baseline")
+    parser.add_argument("--ratio",type=float,default=1.3,help="allowed slowdown factor")
+    parser.add_argument("--slack",type=float,default=0.1,help="allowed extra ms")
+    parser.add_argument("--out",default=None,help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+    results = {}
+    for name in args.scenarios:
+        results[name] = result = run_scenario(name,args.frames)
+        print("{:<14} p50 {p50:6.3f}  p90 {p90:6.3f}  p99 {p99:6.3f}  max {max:6.3f} ms".format(
+              name,**result["ms"])+"  mask tests/frame {:.1f}  surfaces {}  blocks {}".format(
+              result["mask_tests"],result["surfaces"],result["blocks"]))
+    if args.out:
+        with open(args.out,"w") as out:
+            json.dump(results,out,indent=1)
+    if args.save:
+        with open(args.baseline,"w") as out:
+            json.dump(results,out,indent=1)
+        print("Baseline written to {}".format(args.baseline))
+        return 0
+    try:
+        with open(args.baseline) as base:
+            baseline = json.load(base)
+    except (IOError,OSError):
+        print("No baseline at {}; run with --save to make one.".format(args.baseline))
+        return 0
+    failures = compare(results,baseline,args.ratio,args.slack)
+    for failure in failures:
+        print("SLOWER: "+failure)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
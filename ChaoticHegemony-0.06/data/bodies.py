@@ -6,7 +6,11 @@ Functions: shrink_tri(adj,op,size)"""
 import math
 import pygame as pg
 
+from . import controls,narrow,sweep
 from .globs import *
+from .spritecache import SPRITES
+from .simclock import CLOCK,TICK
+from .render import DIRTY
 
 class _Collission:
     """Seperated this into its own class for purposes of organization.  Other objects
@@ -16,37 +20,65 @@ class _Collission:
         """This function together with get_normal and get_components calculate
         collissions between major screen objects and calculate rebound trajectories.
         Theoretically momentum and energy are conserved but outcomes are still twitchy
-        at times."""
+        at times.  Fights use check_pair via the broad phase instead; this is
+        kept for checking against an arbitrary list of objects."""
         for obj in objects:
             if obj is not self:
                 offset = (-self.rect.x+obj.rect.x,-self.rect.y+obj.rect.y)
-                if self.mask.overlap_area(obj.mask,offset):
-                    if obj.mass:
-                        if self.wrapped or obj.wrapped:
-##                            print("wrapped collission")
-                            self.collissions.append(self.abnormal_collission(obj))
-                        else:
-##                            print("normal collission")
-                            unit_norm,unit_tang = self.get_normal(obj,offset)
-                            newspeed = self.get_components(obj,unit_norm,unit_tang)
-                            self.collissions.append(newspeed)
-
-    def get_normal(self,other,offset):
-        """Calculate the normal vector between our object and other.
+                both = narrow.overlap(self.mask,obj.mask,offset)[0]
+                if both:
+                    self.collide(obj,self.get_normal(obj,offset,both))
+
+    def check_pair(self,obj):
+        """Test a candidate pair from the broad phase once (see narrow.py) and
+        let both bodies respond.  If they don't overlap where they ended up,
+        their paths over the tick are searched in case they passed through
+        each other, and they respond as of where they first touched, unless
+        they are already moving apart.  Returns the number of full mask tests
+        made."""
+        offset = (-self.rect.x+obj.rect.x,-self.rect.y+obj.rect.y)
+        both,tests = narrow.overlap(self.mask,obj.mask,offset)
+        swept = not both
+        if swept:
+            mine,theirs = self.get_motion(),obj.get_motion()
+            offset,more = sweep.contact(self.mask,obj.mask,offset,
+                                        (theirs[0]-mine[0],theirs[1]-mine[1]))
+            tests += more
+            if not offset:
+                return tests
+            both = self.mask.overlap_mask(obj.mask,offset)
+            tests += 1
+        (nx,ny),(tx,ty) = normal = self.get_normal(obj,offset,both)
+        if swept and (obj.vel_x-self.vel_x)*nx+(obj.vel_y-self.vel_y)*ny <= 0:
+            #Touched on the way but already moving apart, as after a bounce.
+            return tests
+        self.collide(obj,normal)
+        obj.collide(self,((-nx,-ny),(-tx,-ty)))
+        return tests
+
+    def collide(self,obj,normal):
+        """Our response to having overlapped obj, given the unit normal and
+        tangent of the contact (from get_normal)."""
+        if obj.mass:
+            if self.wrapped or obj.wrapped:
+##                print("wrapped collission")
+                self.collissions.append(self.abnormal_collission(obj))
+            else:
+##                print("normal collission")
+                unit_norm,unit_tang = normal
+                newspeed = self.get_components(obj,unit_norm,unit_tang)
+                self.collissions.append(newspeed)
+
+    def get_normal(self,other,offset,both):
+        """Calculate the normal vector between our object and other, which
+        overlap at both, from the outlines of the two masks (see narrow.py).
         In general this gives the most realistic collissions, but depending on
         the shapes of the colliding objects, it can also return problematic
         results."""
         #Create a double check function that reverts to simple collissions if
         #the trajectory given by this function fails to avoid collission with
         #the same object next frame.
-        dx = (self.mask.overlap_area(other.mask,(offset[0]+1,offset[1]))
-             -self.mask.overlap_area(other.mask,(offset[0]-1,offset[1])))
-        dy = (self.mask.overlap_area(other.mask,(offset[0],offset[1]+1))
-             -self.mask.overlap_area(other.mask,(offset[0],offset[1]-1)))
-        mag = float(math.hypot(dx,dy))
-        unit_normal = (dx/mag,dy/mag)
-        unit_tang   = (-dy/mag,dx/mag)
-        return unit_normal,unit_tang
+        return narrow.normal(self.mask,other.mask,offset,both)
 
     def get_components(self,obj,normal,tangent):
         """Find new normal component of velocity.  Tangential component remains
@@ -89,6 +121,7 @@ class Body(_Collission):
         self.dead = False #No, I'm not dead yet.
         self.dead_frame = 0
         self.dead_timer = 0.0
+        self.clock = CLOCK   #Simulation clock used for all timers.
 
         #angle stuff
         self.angle = -angle
@@ -116,16 +149,14 @@ class Body(_Collission):
         """Takes our initial image and rotates it to the correct angle.
         Rotation can be a destructive process so always rotate the
         initial image to avoid cumulative damage.
+        Rotations are looked up in the shared sprite cache so the image and
+        mask must be treated as read only.
         The size of the image rect will change after rotating, so set
         the new image rect to have the same center as the original."""
-        #I should probably change to pre-rendered sprite rotations both for
-        #purposes of image quality and processing.
         mycenter = self.rect.center
-        self.image = pg.transform.scale(self.initial,(int(self.initial.get_rect().width//self.zoom),
-                                                      int(self.initial.get_rect().height//self.zoom)))
-        self.image = pg.transform.rotate(self.image,self.angle)
-        self.rect = self.image.get_rect(center=mycenter)
-        self.mask = pg.mask.from_surface(self.image)
+        self.image,rect,self.mask = SPRITES.get(self.initial,self.angle,self.zoom)
+        self.rect = rect.copy()
+        self.rect.center = mycenter
 
     def change_zoom(self,zoom,maprect,extra):
         """Changes the zoom and remakes images and masks."""
@@ -139,25 +170,27 @@ class Body(_Collission):
         rotates in the oposite direction we need for our trig functions.
         Fun."""
         self.old_rot = (self.angle,self.calc_angle)
+        turn = self.rot_speed*(self.clock.step/TICK)
         if self.left:
-            self.angle += self.rot_speed
-            self.calc_angle -= self.rot_speed
+            self.angle += turn
+            self.calc_angle -= turn
         if self.right:
-            self.angle -= self.rot_speed
-            self.calc_angle += self.rot_speed
+            self.angle -= turn
+            self.calc_angle += turn
 
     def translate(self):
         """Controls changes in thrust.  The maximum speed is limited using the
         shrink_tri function."""
         ang = math.radians(self.calc_angle)
+        accel = self.accel*(self.clock.step/TICK)
         pol_x = self.speed*math.cos(ang)
         pol_y = self.speed*math.sin(ang)
         if self.thrust:
-            self.vel_x+=pol_x*self.accel
-            self.vel_y+=pol_y*self.accel
+            self.vel_x+=pol_x*accel
+            self.vel_y+=pol_y*accel
         elif self.reverse:
-            self.vel_x-=pol_x*(self.accel/2.0)
-            self.vel_y-=pol_y*(self.accel/2.0)
+            self.vel_x-=pol_x*(accel/2.0)
+            self.vel_y-=pol_y*(accel/2.0)
         self.vel_x,self.vel_y = shrink_tri(self.vel_x,self.vel_y,self.speed)
 
     def wrap_map(self):
@@ -166,47 +199,63 @@ class Body(_Collission):
         #an object appear somewhere already occupied by an object.
         if self.location[0] < 0:
             if self.location[1] < 0:
-                self.location = [PLAYSIZE[0],PLAYSIZE[1]]
-            elif self.location[1] > PLAYSIZE[1]:
-                self.location = [PLAYSIZE[0],0]
+                self.location = [ARENA[0],ARENA[1]]
+            elif self.location[1] > ARENA[1]:
+                self.location = [ARENA[0],0]
             else:
-                self.location = [PLAYSIZE[0],PLAYSIZE[1]-self.location[1]]
+                self.location = [ARENA[0],ARENA[1]-self.location[1]]
             self.wrapped = True
-        elif self.location[0] > PLAYSIZE[0]:
-            if self.location[1] > PLAYSIZE[1]:
+        elif self.location[0] > ARENA[0]:
+            if self.location[1] > ARENA[1]:
                 self.location = [0,0]
             elif self.location[1] < 0:
-                self.location = [0,PLAYSIZE[1]]
+                self.location = [0,ARENA[1]]
             else:
-                self.location = [0,PLAYSIZE[1]-self.location[1]]
+                self.location = [0,ARENA[1]-self.location[1]]
             self.wrapped = True
         if self.location[1] < 0:
-            self.location = [PLAYSIZE[0]-self.location[0],PLAYSIZE[1]]
+            self.location = [ARENA[0]-self.location[0],ARENA[1]]
             self.wrapped = True
-        elif self.location[1] > PLAYSIZE[1]:
-            self.location = [PLAYSIZE[0]-self.location[0],0]
+        elif self.location[1] > ARENA[1]:
+            self.location = [ARENA[0]-self.location[0],0]
             self.wrapped = True
 
     def move_it(self):
         """Updates location based on current velocity.  This location is to
-        scale with the exact location at the furthest out zoom"""
+        scale with the exact location at the furthest out zoom.  Velocities
+        are per TICK of game time; longer clock steps move further."""
         self.old_loc = self.location[:]
-        self.location[0] += self.vel_x
-        self.location[1] += self.vel_y
+        dt = self.clock.step/TICK
+        self.location[0] += self.vel_x*dt
+        self.location[1] += self.vel_y*dt
+
+    def get_motion(self):
+        """How far the body moved on the screen this tick; nothing if it
+        wrapped (it jumped rather than moved) or is dead."""
+        if self.wrapped or self.dead:
+            return (0.0,0.0)
+        scale = 4.0/self.zoom
+        return ((self.location[0]-self.old_loc[0])*scale,(self.location[1]-self.old_loc[1])*scale)
+
+    def get_swept(self):
+        """Screen rect covering the body all along this tick's motion."""
+        mx,my = self.get_motion()
+        return self.rect.union(self.rect.move(-int(mx),-int(my))).inflate(2,2)
 
     def update(self,maprect,extra,collide):
-        """update function called every frame"""
+        """update function called every frame.  collide is the fight's
+        broad phase grid, used to undo rotations into other objects."""
         if self.life <= 0:
             self.dead = True
-            self.mask.clear()
+            self.mask = SPRITES.blank(self.mask.get_size())
         if not self.dead:
             if self.right or self.left:
                 self.rotate()
                 self.make_image()
-                for obj in collide:
+                for obj in collide.query(self.rect):
                     if obj is not self:
                         offset = (-self.rect.x+obj.rect.x,-self.rect.y+obj.rect.y)
-                        if self.mask.overlap_area(obj.mask,offset):
+                        if narrow.overlap(self.mask,obj.mask,offset)[0]:
                             self.angle,self.calc_angle = self.old_rot
                             self.make_image()
             if self.thrust or self.reverse:
@@ -219,19 +268,35 @@ class Body(_Collission):
 
     def draw(self,Surface,maprect,extra):
         """Calculates the ships location on the screen with respect to zoom and
-        draws it to the screen."""
+        draws it to the screen.  If Surface is None nothing is drawn but the
+        position is still settled for the next frame (headless mode)."""
         self.wrap_map()
         self.position(maprect,extra)
-        Surface.blit(self.image,(OFFSET[0]+self.rect.x,OFFSET[1]+self.rect.y))
+        if Surface:
+            DIRTY.add(Surface.blit(self.image,(OFFSET[0]+self.rect.x,OFFSET[1]+self.rect.y)))
         self.wrapped = False #Where else, where else.
+
+    def draw_between(self,Surface,maprect,extra,before,alpha):
+        """Draw the body alpha (0 to 1) of the way from before, its (location,
+        angle) a tick earlier, to where it is now.  Nothing the simulation
+        uses is changed.  Wrapping and exploding bodies are drawn as they are."""
+        (x,y),angle = before
+        dx,dy = self.location[0]-x,self.location[1]-y
+        if abs(dx) > ARENA[0]/2.0 or abs(dy) > ARENA[1]/2.0:
+            x,y = self.location
+        else:
+            x,y = x+dx*alpha,y+dy*alpha
+        image = self.image
+        if angle != self.angle and not (self.dead_frame or self.dead):
+            image = SPRITES.get(self.initial,angle+(self.angle-angle)*alpha,self.zoom)[0]
+        scale = 4.0/self.zoom
+        rect = image.get_rect(center=((x-maprect.x)*scale+extra[0],(y-maprect.y)*scale+extra[1]))
+        DIRTY.add(Surface.blit(image,(OFFSET[0]+rect.x,OFFSET[1]+rect.y)))
+
     def position(self,maprect,extra):
         """Calculate the relativistic position in the current map sector."""
-        if self.zoom == 4.0:
-            self.rect.center = self.location
-        elif self.zoom == 2.0:
-            self.rect.center = ((self.location[0]-maprect.x)*2+extra[0],(self.location[1]-maprect.y)*2+extra[1])
-        elif self.zoom == 1.0:
-            self.rect.center = ((self.location[0]-maprect.x)*4+extra[0],(self.location[1]-maprect.y)*4+extra[1])
+        scale = 4.0/self.zoom
+        self.rect.center = ((self.location[0]-maprect.x)*scale+extra[0],(self.location[1]-maprect.y)*scale+extra[1])
 
     def dying(self):
         print("Blargh!! Dead.")
@@ -241,11 +306,13 @@ class Player(Body):
     """This class will represent our user controlled characters."""
     def __init__(self,location,size,speed,angle):
         Body.__init__(self,location,size,speed,angle)
-        #player keys (default set for player-one)
-        self.keys = PLAYER1_DEFAULT
-        self.ai = False
+        #player controls (default set for player-one; None for none)
+        self.keys = controls.BINDINGS[0]
+        self.ai = None #A pilot.Pilot flies the ship when set.
         self.sleep = False
         self.is_ship = True
+        self.hull = None #Undamaged image; kept once the ship starts exploding.
+        self.wrecks = {} #Explosion images by dead_frame.
 
         self.max_life   = self.life   = 16
         self.max_energy = self.energy = 16
@@ -261,22 +328,27 @@ class Player(Body):
         self.prime_time  = 0.0
         self.second_speed = 3.0
         self.second_time  = 0.0
+        #primary weapon shots (pixels, pixels/frame); used by computer pilots
+        self.shot_range = 100
+        self.shot_speed = 3.0
         #flags for primary and secondary activation
         self.go_prime  = False
         self.go_second = False
 
-    def events(self,keys):
-        """The effect of user keys defined here."""
-        if not self.sleep:
-            #rotations
-            self.right = True if keys[self.keys["right"]] else False
-            self.left  = True if keys[self.keys["left"]]  else False
-            #thrust and reverse
-            self.thrust  = True if keys[self.keys["thrust"]]  else False
-            self.reverse = True if keys[self.keys["reverse"]] else False
-            #Using primary and secondary abilities
-            self.go_prime  = True if keys[self.keys["prime"]]  else False
-            self.go_second = True if keys[self.keys["second"]]  else False
+    def events(self,word):
+        """Set the controls from an action word (see controls.py).  Ignored
+        while a pilot flies and by ships with no keys."""
+        if not self.sleep and not self.ai and self.keys:
+            for bit,name in enumerate(controls.ACTIONS):
+                setattr(self,name,bool(word>>bit&1))
+
+    def tune(self,stats):
+        """Override ship attributes from a dictionary.  Setting life or energy
+        also sets the matching maximum."""
+        for name,value in stats.items():
+            if name in ("life","energy"):
+                setattr(self,"max_"+name,value)
+            setattr(self,name,value)
 
     def update(self,maprect,extra,collide):
         Body.update(self,maprect,extra,collide)
@@ -285,9 +357,9 @@ class Player(Body):
     def primary(self,arg):
         """Check if primary can be used and if so update timers and energy accordingly."""
         if self.energy - self.prim_cost >= 0:
-            if pg.time.get_ticks() - self.prime_time >= 1000/self.prime_speed:
+            if self.clock.get_ticks() - self.prime_time >= 1000/self.prime_speed:
                 self.fire_prime(arg)
-                self.prime_time = pg.time.get_ticks()
+                self.prime_time = self.clock.get_ticks()
                 self.energy -= self.prim_cost
     def fire_prime(self,arg):
         """Place holder for primary ability function."""
@@ -296,9 +368,9 @@ class Player(Body):
     def secondary(self,arg):
         """Check if secondary can be used and if so update timers and energy accordingly."""
         if self.energy - self.second_cost >= 0:
-            if pg.time.get_ticks() - self.second_time >= 1000/self.second_speed:
+            if self.clock.get_ticks() - self.second_time >= 1000/self.second_speed:
                 self.fire_second(arg)
-                self.second_time = pg.time.get_ticks()
+                self.second_time = self.clock.get_ticks()
                 self.energy -= self.second_cost
     def fire_second(self,arg):
         """Place holder for secondary ability function."""
@@ -307,26 +379,41 @@ class Player(Body):
     def regen_energy(self):
         """Regenerates ship's energy at prescribed speed."""
         if self.energy < self.max_energy and not (self.go_prime or self.go_second):
-            if pg.time.get_ticks() - self.regen_timer >= self.regen:
+            if self.clock.get_ticks() - self.regen_timer >= self.regen:
                 self.energy += 1
-                self.regen_timer = pg.time.get_ticks()
+                self.regen_timer = self.clock.get_ticks()
 
     def dying(self):
         """Animates the player exploding on death.
         Explosion animation will be improved later; placeholder for now."""
-        if pg.time.get_ticks() - self.dead_timer > 1000/7.0 and self.dead_frame != 5:
+        if self.clock.get_ticks() - self.dead_timer > 1000/7.0 and self.dead_frame != 5:
             if self.dead_frame < 4:
-                a,b = self.initial.get_rect().center
-                sub = pg.transform.scale(GFX["boom"].subsurface((50*self.dead_frame,0,50,50)),(80,80))
-                self.initial = self.initial.copy()
-                self.initial.blit(sub,(a-40,b-40))
-                self.make_image()
+                self.hull = self.hull or self.initial
                 self.dead_frame += 1
-                self.dead_timer = pg.time.get_ticks()
+                self.set_wreck()
+                self.dead_timer = self.clock.get_ticks()
             else:
-                self.initial.fill((255,0,255))
-                self.image.fill((255,0,255))
                 self.dead_frame = 5
+                self.set_wreck()
+
+    def set_wreck(self):
+        """Set the images for the current dead_frame: the undamaged hull with
+        that many frames of explosion drawn over it, or a blank (colorkey) image
+        once the explosion is over.  Composites are kept in self.wrecks and never
+        drawn on, as snapshots and the sprite cache may share them."""
+        hull = self.hull or self.initial
+        if self.dead_frame and self.dead_frame not in self.wrecks:
+            wreck = hull.copy()
+            if self.dead_frame == 5:
+                wreck.fill((255,0,255))
+            else:
+                a,b = hull.get_rect().center
+                for frame in range(self.dead_frame):
+                    sub = pg.transform.scale(GFX["boom"].subsurface((50*frame,0,50,50)),(80,80))
+                    wreck.blit(sub,(a-40,b-40))
+            self.wrecks[self.dead_frame] = wreck
+        self.initial = self.wrecks[self.dead_frame] if self.dead_frame else hull
+        self.make_image()
 
 ################################################################################
 def shrink_tri(adj,op,size):
@@ -0,0 +1,81 @@
+"""Module: broadphase.py
+Overview: Uniform grid (spatial hash) used to find which bodies are close
+enough to need a mask test.
+Classes: SpatialHash"""
+
+class SpatialHash:
+    """Buckets bodies by the grid cells their swept rects (see
+    Body.get_swept) touch.  Rects are in the same screen space that masks are
+    tested in, so anything that could overlap, or have passed through each
+    other during the tick, is guaranteed to share a cell.  Cell indices use floor division,
+    so rects hanging past the edge of the play area at the wrap seam (negative
+    or beyond the arena) hash correctly too."""
+    def __init__(self,cell=64):
+        self.cell = cell
+        self.cells = {}  #(col,row) -> list of bodies
+        self.where = {}  #body -> cells it currently occupies
+        self.bounds = {} #body -> swept rect it was bucketed by
+        self.order = {}  #body -> index; keeps results in collide list order
+
+    def get_cells(self,rect):
+        """All cell keys touched by rect."""
+        c = self.cell
+        cols = range(rect.left//c,(rect.right-1)//c+1)
+        rows = range(rect.top//c,(rect.bottom-1)//c+1)
+        return [(col,row) for col in cols for row in rows]
+
+    def rebuild(self,objects):
+        """Clear the grid and insert every object."""
+        self.cells.clear()
+        self.where.clear()
+        self.bounds.clear()
+        self.order.clear()
+        for obj in objects:
+            self.insert(obj)
+
+    def insert(self,obj,bounds=None):
+        if obj not in self.order:
+            self.order[obj] = len(self.order)
+        bounds = self.bounds[obj] = bounds or obj.get_swept()
+        keys = self.get_cells(bounds)
+        for key in keys:
+            self.cells.setdefault(key,[]).append(obj)
+        self.where[obj] = keys
+
+    def remove(self,obj):
+        for key in self.where.pop(obj,()):
+            bucket = self.cells[key]
+            bucket.remove(obj)
+            if not bucket:
+                del self.cells[key]
+
+    def move(self,obj):
+        """Call after an object's rect changes.  Cheap if it stayed within the
+        same cells."""
+        bounds = self.bounds[obj] = obj.get_swept()
+        if self.where.get(obj) != self.get_cells(bounds):
+            self.remove(obj)
+            self.insert(obj,bounds)
+
+    def query(self,rect):
+        """Objects whose rects (not swept) overlap rect, in collide list order."""
+        found = set()
+        for key in self.get_cells(rect):
+            for obj in self.cells.get(key,()):
+                if obj not in found and rect.colliderect(obj.rect):
+                    found.add(obj)
+        return sorted(found,key=self.order.get)
+
+    def pairs(self):
+        """Each pair of objects with overlapping swept rects exactly once, as
+        (earlier,later) in collide list order."""
+        order = self.order
+        bounds = self.bounds
+        found = set()
+        for bucket in self.cells.values():
+            for i,obj in enumerate(bucket):
+                for other in bucket[i+1:]:
+                    pair = (obj,other) if order[obj] < order[other] else (other,obj)
+                    if pair not in found and bounds[obj].colliderect(bounds[other]):
+                        found.add(pair)
+        return sorted(found,key=lambda pair:(order[pair[0]],order[pair[1]]))
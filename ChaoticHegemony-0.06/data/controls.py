@@ -0,0 +1,113 @@
+"""Module: controls.py
+Overview: Player input.  Once a tick, just before the simulation runs, the
+keyboard and any joysticks are read a single time and each human player's
+held controls are packed into an action word: one bit per action, in the same
+order replays, snapshots and net play store them (ACTIONS).  The word is handed to
+the ship, which sets its control flags from it.  Key bindings are compiled
+into (bit,key) pairs when made or changed, so sampling does no lookups by
+action name.  Joystick n (or gamepad) flies the player whose binding names
+stick n, alongside that player's keys: the left stick or the hat turns and
+thrusts, and the first two buttons fire the primary and secondary.
+Classes: Binding, Input
+Functions: read_stick(stick)
+Globals: NAMES, ACTIONS, BINDINGS"""
+
+import pygame as pg
+
+from .globs import *
+
+NAMES = ("thrust","reverse","left","right","prime","second") #Binding names in bit order.
+ACTIONS = ("thrust","reverse","left","right","go_prime","go_second") #Player flags in bit order.
+DEAD_ZONE = 0.5 #Stick deflection that counts as held.
+THRUST,REVERSE,LEFT,RIGHT,PRIME,SECOND = (1<<bit for bit in range(len(NAMES)))
+
+class Binding:
+    """A player's controls: a PLAYER*_DEFAULT style dict of keys and the
+    index of the joystick that also flies the ship (None for none)."""
+    def __init__(self,keys,stick=None):
+        self.keys = dict(keys)
+        self.stick = stick
+        self.compile()
+
+    def compile(self):
+        self.pairs = tuple((1<<bit,self.keys[name]) for bit,name in enumerate(NAMES)
+                           if self.keys.get(name) is not None)
+
+    def bind(self,name,key):
+        """Rebind one action (a name in NAMES) to key, or unbind it with None."""
+        if name not in NAMES:
+            raise KeyError(name)
+        self.keys[name] = key
+        self.compile()
+
+    def word(self,pressed,sticks=()):
+        """Action word for the keys held in pressed (from pg.key.get_pressed)
+        and the words read from each joystick."""
+        word = 0
+        for bit,key in self.pairs:
+            if pressed[key]:
+                word |= bit
+        if self.stick is not None and self.stick < len(sticks):
+            word |= sticks[self.stick]
+        return word
+
+class Input:
+    """The input devices.  sample reads them once and gives each human
+    player its action word; the combined word, player one lowest, is kept
+    in word."""
+    def __init__(self):
+        self.sticks = []
+        self.word = 0
+        self.refresh()
+
+    def refresh(self):
+        """Open every joystick that is plugged in."""
+        if not pg.joystick.get_init():
+            pg.joystick.init()
+        self.sticks = [pg.joystick.Joystick(i) for i in range(pg.joystick.get_count())]
+
+    def device_event(self,event):
+        """Keep up with joysticks being plugged in and pulled out."""
+        if event.type in (pg.JOYDEVICEADDED,pg.JOYDEVICEREMOVED):
+            self.refresh()
+
+    def sample(self,Players):
+        """Read the devices and set every human player's controls."""
+        pressed = pg.key.get_pressed()
+        sticks = [read_stick(stick) for stick in self.sticks] if self.sticks else ()
+        word = 0
+        for i,Player in enumerate(Players):
+            if Player.keys and not Player.ai:
+                bits = Player.keys.word(pressed,sticks)
+                Player.events(bits)
+                word |= bits<<i*len(NAMES)
+        self.word = word
+        return word
+
+################################################################################
+def read_stick(stick):
+    """Action word for a joystick's held controls."""
+    word = 0
+    x = y = 0.0
+    if stick.get_numaxes() >= 2:
+        x,y = stick.get_axis(0),stick.get_axis(1)
+    if stick.get_numhats():
+        hat_x,hat_y = stick.get_hat(0)
+        x = hat_x if abs(hat_x) > abs(x) else x
+        y = -hat_y if abs(hat_y) > abs(y) else y #Hats count up as positive.
+    if x < -DEAD_ZONE:
+        word |= LEFT
+    elif x > DEAD_ZONE:
+        word |= RIGHT
+    if y < -DEAD_ZONE:
+        word |= THRUST
+    elif y > DEAD_ZONE:
+        word |= REVERSE
+    buttons = stick.get_numbuttons()
+    if buttons > 0 and stick.get_button(0):
+        word |= PRIME
+    if buttons > 1 and stick.get_button(1):
+        word |= SECOND
+    return word
+
+BINDINGS = [Binding(PLAYER1_DEFAULT,0),Binding(PLAYER2_DEFAULT,1)]
@@ -1,21 +1,46 @@
 """Module: fight.py
-Overview: Control flow for the game while in the FIGHT state.
-Classes: Fight"""
+Overview: Control flow for the game while in the FIGHT state.  Fights are
+between two and eight ships.  Two ships start facing each other as they
+always have; more start on a ring around the middle of the arena, facing in.
+Classes: Fight
+Functions: lineup(count), spawns(count)
+Globals: NUMBERS"""
 
+import math,random
 import pygame as pg
 
-from . import ships,starmap,status
+from . import broadphase,controls,pilot,projectiles,ships,simclock,snapshot,starmap,status
 from .globs import *
+from .profiler import PROFILE
+from .render import DIRTY
+from .textcache import TEXT
+
+#Victory names, by the number of the winning player.
+NUMBERS = ("ONE","TWO","THREE","FOUR","FIVE","SIX","SEVEN","EIGHT")
 
 class Fight:
-    def __init__(self):
-        #Players, Statbars, and Starmap
+    messages = {name:"Player {} is victorious!".format(i+1) for i,name in enumerate(NUMBERS)}
+    messages["BOTH"] = "Mutually Assured Destruction!"
+    def __init__(self,clock=None,stats=None,ships=("BlueWing","Triple"),seed=None):
+        #Simulation clock; advanced once per call to update.
+        self.clock = clock if clock else simclock.SimClock()
+        #Names of the ship classes (in ships.py) flown by each player.
+        self.ships = tuple(ships)
+        #Optional per-player ship attribute overrides, eg. ({"accel":0.04},{})
+        self.stats = stats if stats else tuple({} for ship in self.ships)
+        #Seed for anything random in the fight, kept so replays can repeat it.
+        #Random state made from it must be saved in snapshots, or seeking and
+        #rollback won't repeat.
+        self.seed = random.SystemRandom().randrange(2**31) if seed is None else seed
+        self.recorder = None #Optional replay.Recorder, fed every tick's input.
+        #Players, Statbars, and Starmap; P1 and P2 have the keyboard.
         self.P1 = None
         self.P2 = None
-        self.P1stat = None
-        self.P2stat = None
-        self.Players = (self.P1,self.P2)
+        self.Players = () #Filled in by set_up.
+        self.Statbars = ()
         self.Starmap = None
+        self.Grid = broadphase.SpatialHash()
+        self.Shots = projectiles.Projectiles()
 
         #flags and timers
         self.ready = False
@@ -25,18 +50,33 @@ class Fight:
         self.blink = False
         self.blink_timer = 0.0
         self.message = None #Message to display afteer victory condition met.
+        self.message_rect = None
+        self.anymsg = TEXT.render(fixedsys,"-PRESS ANY KEY-",(255,255,0))
+        self.anymsg_rect = self.anymsg.get_rect(center=(SCREENSIZE[0]//2,400))
         self.nekey = False #Any key to continue.
+        self.previous = None #pose() as of the start of the last tick.
 
     def set_up(self):
-        """Creates the players and map when a fight begins.
-        When ship selection is added the choices will be processed here."""
-        self.P1 = ships.BlueWing([300,100],(50,50),(5,3),135)
-        self.P2 = ships.Triple([450,200],(50,50),(5,3),-45)
-        self.P2.keys = PLAYER2_DEFAULT
-        self.P1stat = status.Statbar(self.P1)
-        self.P2stat = status.Statbar(self.P2)
-        self.Players = (self.P1,self.P2)
-        self.Starmap = starmap.StarMap(GFX["myneb1"],(self.P1,self.P2))
+        """Creates the players and map when a fight begins.  Players past the
+        two keyboard layouts get computer pilots.  Stat bars alternate between
+        the right and left of the screen, stacked when there are more than
+        two.  When ship selection is added the choices will be processed here."""
+        Players = []
+        for i,(name,(location,angle)) in enumerate(zip(self.ships,spawns(len(self.ships)))):
+            Player = getattr(ships,name)(location,(50,50),(5,3),angle)
+            Player.keys = controls.BINDINGS[i] if i < 2 else None
+            Player.ai = None if i < 2 else pilot.Pilot(phase=i)
+            Player.clock = self.clock
+            Players.append(Player)
+        for Player,stats in zip(Players,self.stats):
+            Player.tune(stats)
+        height = SCREENSIZE[1]//((len(Players)+1)//2)
+        self.Statbars = tuple(status.Statbar(Player,(0 if i%2 else 900,i//2*height),i%2 == 1,height)
+                              for i,Player in enumerate(Players))
+        self.Players = tuple(Players)
+        self.P1,self.P2 = Players[:2]
+        zooms = ZOOMS if len(Players) == 2 else SMOOTH_ZOOMS
+        self.Starmap = starmap.StarMap(GFX["myneb1"],self.Players,zooms)
         self.ready = True
 
     def fight_event(self,event):
@@ -51,12 +91,20 @@ class Fight:
         all collissions that have taken place.  Any object that is found to collide with
         another is reset to its starting position that frame with newly calculated
         trajectory vector."""
-        for thing in self.Starmap.collide_objects:
+        objects = self.Starmap.collide_objects
+        self.Grid.rebuild(objects)
+        for thing in objects:
             #Update all objects before checking for collissions
-            thing.update(self.Starmap.rect,self.Starmap.extra,self.Starmap.collide_objects)
-        for thing in self.Starmap.collide_objects:
-            #Check collissions on all objects
-            thing.check_collissions(self.Starmap.collide_objects)
+            thing.update(self.Starmap.rect,self.Starmap.extra,self.Grid)
+            self.Grid.move(thing)
+        self.Shots.update(self.Starmap.rect,self.Starmap.extra,self.Starmap.zoom,
+                          self.clock.step/simclock.TICK)
+        tests = 0
+        for thing,other in self.Grid.pairs():
+            #Mask test each pair with overlapping swept rects once
+            tests += thing.check_pair(other)
+        tests += self.Shots.check_collissions(self.Players)
+        PROFILE.count("mask tests",tests)
         for thing in self.Starmap.collide_objects:
             #If an object collided with another body, reset its position and change its vector
             if thing.collissions:
@@ -72,68 +120,145 @@ class Fight:
         for thing in self.Starmap.collide_objects[:]:
             #Add and remove objects from map as necessary (weapons fire)
             if thing.is_ship and thing.go_prime:
-                thing.primary(self.Starmap.collide_objects)
+                thing.primary(self.Shots)
             if thing.is_ship and thing.go_second:
-                thing.secondary(self.Starmap.collide_objects)
+                thing.secondary(self.Shots)
             if thing.done:
                 self.Starmap.collide_objects.remove(thing)
             thing.draw(Surf,self.Starmap.rect,self.Starmap.extra)
+        if Surf:
+            self.Shots.draw(Surf,self.Starmap.rect,self.Starmap.extra,self.Starmap.zoom)
+        self.Shots.remove_done()
 
     def show_stats(self):
-        """Update stat bars and draw them."""
-        self.P1stat.update()
-        self.P2stat.update()
-        SURFACE.blit(self.P1stat.image,(900,0))
-        SURFACE.blit(pg.transform.flip(self.P2stat.image,True,False),(0,0))
+        """Update stat bars and draw them if they changed or were drawn over."""
+        for stat in self.Statbars:
+            if stat.update() or DIRTY.touches(stat.rect):
+                DIRTY.add(SURFACE.blit(stat.image,stat.rect),False)
 
     def check_victory(self):
-        """Check if a player has been killed each frame."""
-        if self.P1.dead_frame == 5 and not self.P2.dead:
-            self.P2.sleep = True
-            self.victory = "TWO"
-            self.message = fixedsys.render("Player 2 is victorious!",1,(255,255,0))
-            self.count = pg.time.get_ticks()
-        elif self.P2.dead_frame == 5 and not self.P1.dead:
-            self.P1.sleep = True
-            self.victory = "ONE"
-            self.message = fixedsys.render("Player 1 is victorious!",1,(255,255,0))
-            self.count = pg.time.get_ticks()
-        elif self.P2.dead_frame == 5 and self.P1.dead_frame == 5:
+        """Check if a player has been killed each frame.  The fight is won
+        when every other ship has finished exploding; if they all have,
+        nobody wins."""
+        gone = [Player.dead_frame == 5 for Player in self.Players]
+        live = [i for i,Player in enumerate(self.Players) if not Player.dead]
+        if len(live) == 1 and gone.count(False) == 1:
+            self.Players[live[0]].sleep = True
+            self.victory = NUMBERS[live[0]]
+        elif all(gone):
             self.victory = "BOTH"
-            self.message = fixedsys.render("Mutually Assured Destruction!",1,(255,255,0))
-            self.count = pg.time.get_ticks()
+        else:
+            return
+        self.set_message(self.messages[self.victory])
+        self.count = self.clock.get_ticks()
+
+    def snapshot(self):
+        """The simulation state as bytes; see snapshot.py."""
+        return snapshot.take(self)
+
+    def restore(self,data):
+        """Return to a state from snapshot().  The fight must be set up."""
+        snapshot.restore(self,data)
+        self.previous = None
+
+    def set_message(self,text):
+        """Prepare the victory message and where it goes."""
+        self.message = TEXT.render(fixedsys,text,(255,255,0))
+        self.message_rect = self.message.get_rect(center=(SCREENSIZE[0]//2,150))
 
     def final_word(self):
         """Display victory message after a player is defeated."""
-        if pg.time.get_ticks() - self.blink_timer > 1000/5.0:
+        if self.clock.get_ticks() - self.blink_timer > 1000/5.0:
             self.blink = False if self.blink else True
-            self.blink_timer = pg.time.get_ticks()
-        if pg.time.get_ticks() - self.count > 500:
-            msg_rect = self.message.get_rect()
-            msg_rect.center = SURFACE.get_rect().centerx,150
-            SURFACE.blit(self.message,msg_rect)
-            if pg.time.get_ticks() - self.count > 2000:
+            self.blink_timer = self.clock.get_ticks()
+        if self.clock.get_ticks() - self.count > 500:
+            DIRTY.add(SURFACE.blit(self.message,self.message_rect))
+            if self.clock.get_ticks() - self.count > 2000:
                 if self.blink:
-                    anymsg = fixedsys.render("-PRESS ANY KEY-",1,(255,255,0))
-                    anymsg_rect = anymsg.get_rect()
-                    anymsg_rect.center = SURFACE.get_rect().centerx,400
-                    SURFACE.blit(anymsg,anymsg_rect)
+                    DIRTY.add(SURFACE.blit(self.anymsg,self.anymsg_rect))
                 self.nekey = True
 
+    def draw(self,Surf,alpha=None):
+        """Draw the fight as it stands without simulating anything; for fights
+        whose state is restored from elsewhere (see pipeline.py), or, given
+        alpha, to draw alpha (0 to 1) of the way from the tick before to the
+        current one when frames fall between ticks."""
+        Starmap = self.Starmap
+        before = self.previous if alpha is not None else None
+        if before:
+            camera = Starmap.center,Starmap.rect,Starmap.extra
+            Starmap.glide(before[1],alpha)
+        Starmap.draw_bg()
+        for thing in Starmap.collide_objects:
+            if before and thing in before[0]:
+                thing.draw_between(Surf,Starmap.rect,Starmap.extra,before[0][thing],alpha)
+            else:
+                thing.draw(Surf,Starmap.rect,Starmap.extra)
+        back = (1.0-alpha)*self.clock.step/simclock.TICK if before else 0.0
+        self.Shots.draw(Surf,Starmap.rect,Starmap.extra,Starmap.zoom,back)
+        if before:
+            Starmap.center,Starmap.rect,Starmap.extra = camera
+        self.show_stats()
+        if self.victory:
+            self.final_word()
+
+    def pose(self):
+        """What draw needs to draw between this tick and the next: each body's
+        (location,angle) and the camera's (center,zoom)."""
+        return ({thing:(thing.location[:],thing.angle) for thing in self.Starmap.collide_objects},
+                (self.Starmap.center,self.Starmap.zoom))
+
     def update(self,Surf):
-        """Updater for screen during a FIGHT."""
+        """Updater for screen during a FIGHT.  Passing None for Surf runs the
+        full simulation without drawing anything (headless mode)."""
         #If the fight has just begun, initialize first.
         if not self.ready:
             #Prepare players and map
             self.set_up()
+        self.previous = self.pose()
+        start = PROFILE.now()
+        for Player in self.Players:
+            if Player.ai and not Player.sleep:
+                Player.ai.fly(Player,self)
+        start = PROFILE.lap("fight.ai",start)
+        if self.recorder:
+            self.recorder.record(self)
+        self.clock.tick()
         self.process_collissions()
+        start = PROFILE.lap("fight.collide",start)
         #Update and draw map.
         self.Starmap.update()
-        self.Starmap.draw_bg()
+        if Surf:
+            self.Starmap.draw_bg()
+        start = PROFILE.lap("fight.starmap",start)
         self.add_remove(Surf)
-        self.show_stats()
+        start = PROFILE.lap("fight.add_remove",start)
+        if Surf:
+            self.show_stats()
         #Check victory conditions and blit messages as needed.
         if not self.victory:
             self.check_victory()
+        elif Surf:
+            self.final_word()
         else:
-            self.final_word()
\ No newline at end of file
+            self.nekey = self.clock.get_ticks() - self.count > 2000
+        PROFILE.lap("fight.stats",start)
+        PROFILE.gauge("objects",len(self.Starmap.collide_objects)+len(self.Shots))
+
+################################################################################
+def lineup(count):
+    """Ship names for a fight between count players; the two ship types in turn."""
+    return tuple(("BlueWing","Triple")[i%2] for i in range(count))
+
+def spawns(count):
+    """([x,y],angle) starting places for count ships."""
+    if count == 2:
+        return [([300,100],135),([450,200],-45)]
+    radius = min(ARENA)*0.35
+    places = []
+    for i in range(count):
+        bearing = 360.0*i/count #Clockwise from straight up, like ship angles.
+        x = ARENA[0]/2.0+radius*math.sin(math.radians(bearing))
+        y = ARENA[1]/2.0-radius*math.cos(math.radians(bearing))
+        places.append(([x,y],bearing+180))
+    return places
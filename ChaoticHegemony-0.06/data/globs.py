@@ -1,22 +1,61 @@
 """Module: globs.py
 Overview: Display initialization, global constants, and graphic/font loading.
-Functions: getgraphics(directory,alpha=False)"""
+Setting the environment variable HEGEMONY_HEADLESS=1 before import runs without
+a window; no display is created and images are loaded unconverted.
+HEGEMONY_ARENA=N makes the arena N times the play area in each direction.
+HEGEMONY_PLAYERS=N (2 to 8) sets how many ships fight; the ships past the two
+keyboard layouts are flown by computer pilots.
+HEGEMONY_RENDER_FPS=N draws up to N frames a second; the simulation stays at
+FPS ticks a second and, when N is higher than FPS, each frame shows the fight
+part way between its last two ticks.  HEGEMONY_INTERPOLATE=0 or 1 turns that
+off or on regardless.
+GFX and GFXA load images lazily; see assets.py for the packed bundle.
+Functions: init_display(), prepare(surface,alpha=False)"""
 
 import os
 import pygame as pg
 
+from . import assets
+
 os.environ['SDL_VIDEO_CENTERED'] = '1'
 
-FPS = 64.0              #Global frames per second (desired)
+FPS = 64.0              #Global simulation ticks per second
+RENDER_FPS = float(os.environ.get("HEGEMONY_RENDER_FPS","") or FPS) #Rendered frames per second (desired)
+INTERPOLATE = os.environ.get("HEGEMONY_INTERPOLATE","1" if RENDER_FPS > FPS else "0") not in ("","0") #Draw between ticks
+MAX_TICKS  = 5          #Most simulation ticks run per rendered frame
 SCREENSIZE = (1000,600) #Global screen size
 PLAYSIZE   = (800,600)  #Global size of play area
+ARENA_SCALE = max(1,int(os.environ.get("HEGEMONY_ARENA","1") or 1))
+ARENA = (PLAYSIZE[0]*ARENA_SCALE,PLAYSIZE[1]*ARENA_SCALE) #Size of the world
+#Zoom levels; the play area shows a PLAYSIZE*zoom/4 sector of the world, so
+#the last one shows all of it.
+ZOOMS = tuple(float(2**i) for i in range(8) if 2**i < 4*ARENA_SCALE)+(4.0*ARENA_SCALE,)
+#Eight zoom levels to each doubling, for the free-for-all camera.
+SMOOTH_ZOOMS = tuple(2**(i/8.0) for i in range(64) if 2**(i/8.0) < ZOOMS[-1])+(ZOOMS[-1],)
+PLAYERS = min(8,max(2,int(os.environ.get("HEGEMONY_PLAYERS","2") or 2))) #Ships in a fight
 OFFSET     = (100,0)    #Global location of play area within screen
-SURFACE = pg.display.set_mode(SCREENSIZE)
+HEADLESS   = os.environ.get("HEGEMONY_HEADLESS","0") not in ("","0")
+if HEADLESS:
+    os.environ.setdefault('SDL_VIDEODRIVER','dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER','dummy')
+    os.environ.setdefault('SDL_NO_SIGNAL_HANDLERS','1') #Let SIGINT/SIGTERM kill batch runs.
+SURFACE = None
+
+def init_display():
+    """Create the game window.  Only called at import when not headless, so
+    simulation code never depends on a video mode existing."""
+    global SURFACE
+    if not SURFACE:
+        SURFACE = pg.display.set_mode(SCREENSIZE)
+    return SURFACE
+
+if not HEADLESS:
+    init_display()
 pg.init()
 
 #Fonts
-basicFont = pg.font.Font(os.path.join('graphics','ArialNb.TTF'),48)
-fixedsys  = pg.font.Font(os.path.join('graphics','Fixedsys500c.ttf'),60)
+basicFont = pg.font.Font(os.path.join(assets.ROOT,'graphics','ArialNb.TTF'),48)
+fixedsys  = pg.font.Font(os.path.join(assets.ROOT,'graphics','Fixedsys500c.ttf'),60)
 
 #Player one controls
 PLAYER1_DEFAULT = {"thrust" :pg.K_UP,
@@ -33,21 +72,16 @@ PLAYER2_DEFAULT = {"thrust" :pg.K_w,
                    "prime"  :pg.K_SPACE,
                    "second" :pg.K_LSHIFT}
 
-def getgraphics(directory,alpha=False):
-    """Returns a dictionary of all the image files in a directory.
-    Dictionary keys are image names minus their file extensions."""
-    dirlist = os.listdir(directory)
-    graphic = {}
-    for graf in dirlist:
-        if graf[-3:] in ("png","jpg"):
-            if not alpha:
-                graphic[graf[:-4]] = pg.image.load(os.path.join(directory,graf)).convert()
-                graphic[graf[:-4]].set_colorkey((255,0,255))
-            else:
-                graphic[graf[:-4]] = pg.image.load(os.path.join(directory,graf)).convert_alpha()
-    return graphic
-
-GFX  = getgraphics("graphics")
-GFXA = getgraphics("graphalpha",True)
+def prepare(surface,alpha=False):
+    """Convert a surface to the display format if there is a display.
+    Headless runs keep the surface as is; colorkeys and masks are unaffected."""
+    if not pg.display.get_surface():
+        return surface
+    return surface.convert_alpha() if alpha else surface.convert()
+
+#Images are loaded on first use, from the asset bundle when it is up to date.
+BUNDLE = assets.open_bundle()
+GFX  = assets.Graphics("graphics",False,BUNDLE,prepare)
+GFXA = assets.Graphics("graphalpha",True,BUNDLE,prepare)
 
 SHIPS = ("intrepid_alt","wing_blue","tripple","ship_blue","ship_red","ship_up")###
\ No newline at end of file
@@ -2,64 +2,167 @@
 Overview: Primary control flow for entire game.
 Classes: Control"""
 
-import os,sys #used for os.environ and sys.exit
+import os,sys,time #used for os.environ, sys.exit and export names
 
 import pygame as pg #lazy but better than destroying namespace
 
-from . import fight,title
+from . import controls,pilot,pipeline,scenes,simclock
 from .globs import *
+from .profiler import PROFILE
+from .render import DIRTY
+from .textcache import TEXT
 
 class Control:
     def __init__(self):
         self.showfps = False
+        self.showhud = False
         self.myclock = pg.time.Clock()
         self.state = "TITLE"
+        #Fixed timestep accumulator (milliseconds of unsimulated real time).
+        self.lag = 0.0
+        self.speed = 1 #Fast-forward multiplier.
+        #FPS readout; refreshed a few times a second rather than every frame.
+        self.fps_text = ""
+        self.fps_time = 0
+        self.Input = controls.Input()
+        self.Scenes = scenes.Scenes()
 
-        self.Titler  = title.Title()
-        self.Fighter = fight.Fight()
+    @property
+    def Titler(self):
+        return self.Scenes.Titler
+
+    @property
+    def Fighter(self):
+        return self.Scenes.Fighter
 
     def quit_game(self):
         """Call this anytime the program needs to close cleanly."""
+        if pipeline.ENABLED:
+            self.Fighter.close()
         pg.quit();sys.exit()
 
     def control_events(self):
-        """Our event loop goes here."""
-        keys = pg.key.get_pressed() ##
+        """Our event loop goes here.  Held controls are not read here but
+        sampled each tick, just before it is simulated."""
         for event in pg.event.get():
-            keys = pg.key.get_pressed()
-            if event.type == pg.QUIT or keys[pg.K_ESCAPE]:
+            if event.type == pg.QUIT:
                  self.quit_game()
             elif event.type == pg.KEYDOWN:
-                if event.key == pg.K_F5:
+                if event.key == pg.K_ESCAPE:
+                    self.quit_game()
+                elif event.key == pg.K_F5:
                     self.showfps = True if not self.showfps else False
+                elif event.key == pg.K_F6:
+                    self.speed = 4 if self.speed == 1 else 1
+                elif event.key == pg.K_F7:
+                    self.toggle_hud()
+                elif event.key == pg.K_F8:
+                    self.export_profile("csv" if event.mod & pg.KMOD_SHIFT else "json")
+                elif event.key == pg.K_F9:
+                    self.save_replay()
+                elif event.key == pg.K_F10:
+                    self.toggle_pilot(0 if event.mod & pg.KMOD_SHIFT else 1)
             elif event.type == pg.KEYUP:  pass
+            else:
+                self.Input.device_event(event)
 
             if self.state == "TITLE":
                 self.Titler.title_event(event)
             elif self.state == "FIGHT":
                 self.Fighter.fight_event(event)
-                try: #exception probably won't be necessary eventually
-                    for Player in self.Fighter.Players:
-                        Player.events(keys)
-                except AttributeError:
-##                    print("Ships not initialized yet.")
-                    pass
+
+    def get_ticks(self,elapsed):
+        """Add elapsed real time to the accumulator and return how many fixed
+        simulation ticks are owed.  Capped at MAX_TICKS*speed so a long stall
+        doesn't snowball; the remainder is dropped."""
+        self.lag += elapsed*self.speed
+        ticks = int(self.lag//simclock.TICK)
+        self.lag -= ticks*simclock.TICK
+        if ticks > MAX_TICKS*self.speed:
+            ticks = MAX_TICKS*self.speed
+            self.lag = 0.0
+        return ticks
+
+    def update_state(self,Surf):
+        """Run a single simulation tick of the current state.  Drawing only
+        happens when Surf is given."""
+        if self.state == "TITLE":
+            self.Titler.update(Surf)
+            if self.Scenes.ready() and self.Titler.done:
+                self.state = "FIGHT"
+        elif self.state == "FIGHT":
+            self.Input.sample(self.Fighter.Players)
+            self.Fighter.update(None if self.blending() else Surf)
+            if self.Fighter.done:
+                self.state = "TITLE"
+                self.lag = 0.0
+                self.Scenes.show_title()
+
+    def blending(self):
+        """Whether fight frames are drawn between ticks (see draw_between)
+        rather than by the tick that precedes them."""
+        return (INTERPOLATE and self.state == "FIGHT" and not pipeline.ENABLED
+                and self.Fighter.ready)
+
+    def draw_between(self,Surf):
+        """Draw the fight as far between its last tick and the next as the
+        accumulator has got; every frame, whether or not a tick ran."""
+        self.Fighter.draw(Surf,self.lag/simclock.TICK)
+
+    def toggle_hud(self):
+        """The profiler only records while its HUD is up (or HEGEMONY_PROFILE
+        is set), so timing costs nothing the rest of the time."""
+        self.showhud = not self.showhud
+        PROFILE.enabled = self.showhud or os.environ.get("HEGEMONY_PROFILE","0") not in ("","0")
+
+    def export_profile(self,kind):
+        """Dump the profiler's buffers to profile-<time>.json (or .csv)."""
+        if PROFILE.phases:
+            path = PROFILE.export(time.strftime("profile-%Y%m%d-%H%M%S.")+kind)
+            print("Profile written to {}".format(path))
+
+    def save_replay(self):
+        """Save the current fight, up to now, to replay-<time>.rep."""
+        if self.Fighter.recorder.words:
+            path = self.Fighter.recorder.save(time.strftime("replay-%Y%m%d-%H%M%S.rep"))
+            print("Replay written to {}".format(path))
+
+    def toggle_pilot(self,side):
+        """Hand a ship (0 for player one) to a computer pilot, or back."""
+        if side < len(self.Fighter.Players):
+            Player = self.Fighter.Players[side]
+            Player.ai = None if Player.ai else pilot.Pilot(phase=2*side)
+            Player.left = Player.right = Player.thrust = Player.reverse = False
+            Player.go_prime = Player.go_second = False
+
+    def show_fps(self):
+        """Draw the frame rate, rounded and updated four times a second."""
+        if pg.time.get_ticks() - self.fps_time > 250:
+            self.fps_text = "%d" % round(self.myclock.get_fps())
+            self.fps_time = pg.time.get_ticks()
+        DIRTY.add(SURFACE.blit(TEXT.render(basicFont,self.fps_text,(255,255,255)),(900,550)))
 
     def main(self):
         """Control flow for everything"""
+        ticks = 1
         while 1:
+            start = PROFILE.now()
             self.control_events()
-            if self.state == "TITLE":
-                self.Titler.update(SURFACE)
-                if self.Titler.done:
-                    self.state = "FIGHT"
-            elif self.state == "FIGHT":
-                self.Fighter.update(SURFACE)
-                if self.Fighter.done:
-                    self.state = "TITLE"
-                    self.__init__()###
-
-            if self.showfps:
-                SURFACE.blit(basicFont.render(str(self.myclock.get_fps()),1,(255,255,255)),(900,550))
-            self.myclock.tick(FPS)
-            pg.display.update()
+            start = PROFILE.lap("main.events",start)
+            for tick in range(ticks):
+                self.update_state(SURFACE if tick == ticks-1 else None)
+            start = PROFILE.lap("main.update",start)
+            blend = self.blending()
+            if blend:
+                self.draw_between(SURFACE)
+                start = PROFILE.lap("main.draw",start)
+            if ticks or blend:
+                if self.showfps:
+                    self.show_fps()
+                if self.showhud:
+                    PROFILE.draw(SURFACE)
+                DIRTY.flush()
+            start = PROFILE.lap("main.flush",start)
+            PROFILE.frame()
+            ticks = self.get_ticks(self.myclock.tick(RENDER_FPS))
+            PROFILE.lap("main.wait",start)
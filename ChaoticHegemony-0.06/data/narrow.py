@@ -0,0 +1,134 @@
+"""Module: narrow.py
+Overview: Layered mask tests between two bodies.  A pair is rejected as
+cheaply as it can be: by the bounding circles of the masks' set pixels, then
+by the rects of those pixels, then by coarse masks with one bit for each
+BLOCK square of pixels.  Only pairs that get through all three are tested at
+full resolution, and only once, which gives the overlap itself.  The normal
+of a hit is then read from outline normal tables made once per mask: the
+outward normals of each mask's outline where it lies inside the other are
+summed, rather than estimated with more mask tests.  Everything is cached by mask;
+masks are shared through the sprite cache.
+Classes: Shape
+Functions: shape(mask), coarsen(mask), to_mask(bits), overlap(mask,other,offset),
+           normal(mask,other,offset,both), summed(both,area,Shape,offset)
+Globals: BLOCK"""
+
+import math
+import numpy as np
+import pygame as pg
+
+from . import sweep
+
+BLOCK = 4 #Pixels along each side of a coarse mask bit.
+SHAPES = {} #mask -> Shape
+
+class Shape:
+    """What the layered test needs to know about a mask with pixels set:
+    their bounding rect, bounding circle, coarse mask, and the outline with
+    the outward unit normal at each of its points."""
+    __slots__ = ("rect","center","radius","coarse","spread","pixels","normals")
+    def __init__(self,mask,rect):
+        self.rect = rect
+        self.center = (rect.x+rect.width/2.0,rect.y+rect.height/2.0)
+        points = np.array(mask.outline() or [rect.center],float)
+        offsets = points+0.5-self.center
+        self.radius = math.hypot(rect.width,rect.height)/2.0
+        self.coarse,self.spread = coarsen(mask)
+        #The outline is traced in one direction, so turning every tangent the
+        #same way gives normals all pointing in or all out; most point away
+        #from the center when they point out.
+        tangents = np.roll(points,-2,0)-np.roll(points,2,0)
+        normals = np.column_stack((tangents[:,1],-tangents[:,0]))
+        if (normals*offsets).sum() < 0:
+            normals = -normals
+        lengths = np.hypot(*normals.T)
+        flat = lengths == 0 #Where the outline doubles back on itself.
+        normals[flat] = offsets[flat]
+        lengths[flat] = np.maximum(np.hypot(*offsets[flat].T),1e-9)
+        self.pixels = points.astype(int)
+        self.normals = normals/lengths[:,None]
+
+def shape(mask):
+    """The Shape of mask, or None if it is empty."""
+    try:
+        return SHAPES[mask]
+    except KeyError:
+        rect = sweep.solid(mask)
+        if not rect:
+            return None
+        if len(SHAPES) > 4096:
+            SHAPES.clear()
+        result = SHAPES[mask] = Shape(mask,rect)
+        return result
+
+def coarsen(mask):
+    """Coarse masks with a bit set for each BLOCK square holding a set pixel,
+    and the same spread one block right and down.  A mask's coarse mask
+    overlaps another's spread one, at the offset divided by BLOCK and rounded
+    down, wherever the masks themselves could overlap."""
+    width,height = mask.get_size()
+    cols,rows = -(-width//BLOCK),-(-height//BLOCK)
+    bits = np.zeros((cols*BLOCK,rows*BLOCK),bool)
+    bits[:width,:height] = pg.surfarray.array_red(mask.to_surface()) > 127
+    blocks = bits.reshape(cols,BLOCK,rows,BLOCK).any(3).any(1)
+    spread = np.zeros((cols+1,rows+1),bool)
+    for x in (0,1):
+        for y in (0,1):
+            spread[x:x+cols,y:y+rows] |= blocks
+    return to_mask(blocks),to_mask(spread)
+
+def to_mask(bits):
+    """A Mask of a (width,height) bool array."""
+    image = pg.surfarray.make_surface(bits.astype(np.uint8))
+    image.set_colorkey(0)
+    return pg.mask.from_surface(image)
+
+def overlap(mask,other,offset):
+    """Where other, at offset from mask, overlaps it, as a mask the size of
+    mask, or None if it doesn't.  Returns that and the number of full
+    resolution mask tests made, which is at most one."""
+    a,b = shape(mask),shape(other)
+    if not a or not b:
+        return None,0
+    x,y = offset
+    dx,dy = b.center[0]+x-a.center[0],b.center[1]+y-a.center[1]
+    reach = a.radius+b.radius
+    if dx*dx+dy*dy > reach*reach:
+        return None,0
+    if not a.rect.colliderect(b.rect.move(x,y)):
+        return None,0
+    if not a.coarse.overlap(b.spread,(x//BLOCK,y//BLOCK)):
+        return None,0
+    both = mask.overlap_mask(other,offset)
+    return (both if both.count() else None),1
+
+def normal(mask,other,offset,both):
+    """Unit normal and tangent of the contact between mask and other at
+    offset, where both is their overlap (from overlap).  The normal points
+    from other into mask: the outward normals of other's outline inside mask
+    less those of mask's outline inside other.  If those cancel out, the line
+    between the shapes' centers is used."""
+    a,b = shape(mask),shape(other)
+    nx = ny = 0.0
+    if a and b:
+        rects = both.get_bounding_rects()
+        area = rects[0].unionall(rects[1:])
+        nx,ny = (summed(both,area,b,offset)-summed(both,area,a,(0,0))).tolist()
+    mag = math.hypot(nx,ny)
+    if mag < 1e-6 and a and b:
+        nx = a.center[0]-b.center[0]-offset[0]
+        ny = a.center[1]-b.center[1]-offset[1]
+        mag = math.hypot(nx,ny)
+    if mag < 1e-6:
+        return (1.0,0.0),(0.0,1.0)
+    nx,ny = nx/mag,ny/mag
+    return (nx,ny),(-ny,nx)
+
+def summed(both,area,Shape,offset):
+    """Sum of the outward normals of Shape's outline, placed at offset, where
+    it lies on set bits of both; area bounds those bits."""
+    x = Shape.pixels[:,0]+offset[0]
+    y = Shape.pixels[:,1]+offset[1]
+    near = np.flatnonzero((x >= area.left)&(x < area.right)&(y >= area.top)&(y < area.bottom))
+    on = [i for i in near.tolist() if both.get_at((int(x[i]),int(y[i])))]
+    return Shape.normals[on].sum(0) if on else np.zeros(2)
@@ -0,0 +1,332 @@
+"""Module: net.py
+Overview: Networked versus mode over UDP with rollback.  Each peer flies one
+ship and sends only its input words.  The remote player's input is predicted
+(it keeps doing whatever it did last) so the local simulation never waits;
+when the real input arrives and differs, the fight is restored to the tick it
+was mispredicted at and re-simulated, without drawing, up to the present.
+Local input is delayed a couple of ticks to make that rare.  Run from the game
+directory; both peers use player one's keys:
+    python -m data.net host [ADDRESS:]PORT
+    python -m data.net join ADDRESS:PORT [--latency MS --jitter MS --loss P]
+    python -m data.net selftest [--latency MS --jitter MS --loss P]
+Classes: Session, Peer, LossyTransport
+Functions: run_peer(...), selftest(...), main(argv=None)"""
+
+import os,sys
+if __name__ == "__main__" and "selftest" in sys.argv:
+    os.environ.setdefault("HEGEMONY_HEADLESS","1") #Must happen before globs is imported.
+
+import argparse,asyncio,random,struct,time
+import pygame as pg
+
+from . import controls,fight,replay,simclock
+from .globs import *
+from .render import DIRTY
+
+#Packet types.  INPUT is followed by count input words, one byte each.
+HELLO,WELCOME,INPUT = 1,2,3
+HEADER = struct.Struct("<BIbII") #type, ack (remote ticks received), advantage, first tick, count
+SEED = struct.Struct("<BI")     #WELCOME, seed
+
+class Session:
+    """Rollback state for one peer.  side is 0 or 1, the ship this peer flies.
+    delay is how many ticks local input is held back; window is how far the
+    simulation may run ahead of the last tick the remote input is known for
+    before it stalls and waits."""
+    def __init__(self,Fighter,side,delay=2,window=8):
+        self.Fighter = Fighter
+        self.side = side
+        self.delay = delay
+        self.window = window
+        #Known input words for each side, by tick.  The first delay ticks are idle.
+        self.inputs = ({tick:0 for tick in range(delay)},{tick:0 for tick in range(delay)})
+        self.local_tick = delay  #Next tick local input will be given for.
+        self.remote_tick = delay #Remote input is known for every tick before this.
+        self.predicted = {}      #Remote words used for ticks before remote_tick was reached.
+        self.snapshots = {}      #State before each tick simulated on a prediction.
+        self.rollback = None     #Earliest tick found to be mispredicted.
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.resim_time = 0.0
+
+    def add_local(self,word):
+        self.inputs[self.side][self.local_tick] = word
+        self.local_tick += 1
+
+    def receive(self,first,words):
+        """Take remote input words for ticks first, first+1, ..."""
+        remote = self.inputs[1-self.side]
+        for tick,word in enumerate(words,first):
+            if tick in remote:
+                continue
+            remote[tick] = word
+            if tick in self.predicted and self.predicted[tick] != word:
+                if self.rollback is None or tick < self.rollback:
+                    self.rollback = tick
+        while self.remote_tick in remote:
+            self.predicted.pop(self.remote_tick,None)
+            self.remote_tick += 1
+
+    @property
+    def tick(self):
+        return self.Fighter.clock.ticks
+
+    def can_advance(self):
+        return self.tick < self.local_tick and self.tick < self.remote_tick+self.window
+
+    def remote_word(self,tick):
+        """The remote input for tick; real if known, otherwise predicted."""
+        remote = self.inputs[1-self.side]
+        if tick in remote:
+            return remote[tick]
+        word = self.predicted[tick] = remote[self.remote_tick-1]
+        return word
+
+    def simulate(self,Surf=None):
+        """Simulate the next tick, snapshotting first if it uses a prediction."""
+        tick = self.tick
+        if tick >= self.remote_tick:
+            self.snapshots[tick] = self.Fighter.snapshot()
+        words = [None,None]
+        words[self.side] = self.inputs[self.side][tick]
+        words[1-self.side] = self.remote_word(tick)
+        for Player,word in zip(self.Fighter.Players,words):
+            replay.set_word(Player,word)
+        self.Fighter.update(Surf)
+
+    def correct(self):
+        """Roll back to the earliest mispredicted tick and re-simulate, without
+        drawing, back to where we were."""
+        if self.rollback is not None:
+            begin = time.perf_counter()
+            target = self.tick
+            self.Fighter.restore(self.snapshots[self.rollback])
+            self.predicted = {tick:word for tick,word in self.predicted.items()
+                              if tick < self.rollback}
+            while self.tick < target:
+                self.simulate()
+            self.rollbacks += 1
+            self.resimulated += target-self.rollback
+            self.resim_time += time.perf_counter()-begin
+            self.rollback = None
+        for tick in [tick for tick in self.snapshots if tick < self.remote_tick]:
+            del self.snapshots[tick]
+
+    def advance(self,Surf=None):
+        """Fix any mispredictions then simulate the next tick if allowed.
+        Returns True if a tick was simulated."""
+        self.correct()
+        if not self.can_advance():
+            return False
+        self.simulate(Surf)
+        return True
+
+    def advantage(self):
+        """How many ticks we are ahead of the remote's input.  Latency makes
+        this positive on both peers; if one peer's is larger it is running
+        ahead and will mispredict more, so it should wait a tick."""
+        return self.tick-self.remote_tick+self.delay
+
+    def packet(self,ack):
+        """INPUT packet with every local word the remote hasn't acknowledged."""
+        first = max(ack,self.local_tick-64)
+        local = self.inputs[self.side]
+        words = bytes(local[tick] for tick in range(first,self.local_tick))
+        advantage = max(-128,min(self.advantage(),127))
+        return HEADER.pack(INPUT,self.remote_tick,advantage,first,len(words))+words
+
+class Peer(asyncio.DatagramProtocol):
+    """UDP endpoint.  Hosts wait for a HELLO and answer with the fight seed;
+    joiners send HELLO until they get it.  After that every datagram carries
+    input words."""
+    def __init__(self,host,seed=None):
+        self.host = host
+        self.seed = seed
+        self.address = None
+        self.transport = None
+        self.session = None
+        self.ack = 0 #How many of our ticks the remote has received.
+        self.advantage = 0 #The remote session's advantage().
+        self.ready = asyncio.get_event_loop().create_future()
+
+    def connection_made(self,transport):
+        if not self.transport:
+            self.transport = transport
+
+    def send(self,data):
+        if self.address:
+            self.transport.sendto(data,self.address)
+
+    def datagram_received(self,data,address):
+        kind = data[0]
+        if kind == HELLO and self.host:
+            self.address = address
+            self.send(SEED.pack(WELCOME,self.seed))
+            if not self.ready.done():
+                self.ready.set_result(self.seed)
+        elif kind == WELCOME and not self.host and not self.ready.done():
+            self.seed = SEED.unpack_from(data)[1]
+            self.ready.set_result(self.seed)
+        elif kind == INPUT and self.session:
+            kind,ack,self.advantage,first,count = HEADER.unpack_from(data)
+            self.ack = max(self.ack,ack)
+            self.session.receive(first,data[HEADER.size:HEADER.size+count])
+
+    async def connect(self,address=None):
+        """Wait for the other peer; joiners keep saying hello until answered."""
+        if not self.host:
+            self.address = address
+            while not self.ready.done():
+                self.send(bytes((HELLO,)))
+                await asyncio.sleep(0.1)
+        return await self.ready
+
+class LossyTransport:
+    """Wraps a datagram transport to delay and drop outgoing packets, for
+    testing over localhost."""
+    def __init__(self,transport,latency=0.0,jitter=0.0,loss=0.0,seed=None):
+        self.transport = transport
+        self.latency = latency/1000.0
+        self.jitter = jitter/1000.0
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.loop = asyncio.get_event_loop()
+        self.pending = {} #number -> TimerHandle of each delayed send.
+        self.sent = 0
+
+    def sendto(self,data,address):
+        if self.rng.random() < self.loss:
+            return
+        delay = self.latency+self.rng.uniform(0,self.jitter)
+        self.sent += 1
+        self.pending[self.sent] = self.loop.call_later(delay,self.deliver,self.sent,data,address)
+
+    def deliver(self,number,data,address):
+        del self.pending[number]
+        if not self.transport.is_closing():
+            self.transport.sendto(data,address)
+
+    def close(self):
+        """Close the transport, dropping the sends still waiting."""
+        for handle in self.pending.values():
+            handle.cancel()
+        self.pending.clear()
+        self.transport.close()
+
+################################################################################
+async def open_peer(host,bind,seed=None,latency=0.0,jitter=0.0,loss=0.0):
+    loop = asyncio.get_event_loop()
+    transport,peer = await loop.create_datagram_endpoint(lambda: Peer(host,seed),local_addr=bind)
+    if latency or jitter or loss:
+        peer.transport = LossyTransport(transport,latency,jitter,loss)
+    return peer
+
+async def run_peer(peer,address=None,pilot=None,ticks=None,draw=True,speed=1.0):
+    """Play a networked fight.  Local input comes from the keyboard, or from
+    pilot(Player,enemy,rng) if given.  Stops after ticks ticks if given.
+    Returns the session."""
+    seed = await peer.connect(address)
+    side = 0 if peer.host else 1
+    Fighter = fight.Fight(simclock.SimClock(),seed=seed)
+    Fighter.set_up()
+    session = peer.session = Session(Fighter,side)
+    local = Fighter.Players[side]
+    rng = random.Random(seed+side)
+    loop = asyncio.get_event_loop()
+    lag,last = 0.0,loop.time()
+    step = simclock.TICK/1000.0/speed
+    wait = 0 #Don't wait again for time sync before this tick.
+    while not Fighter.done and (ticks is None or Fighter.clock.ticks < ticks):
+        if draw:
+            for event in pg.event.get():
+                if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                    return session
+                Fighter.fight_event(event)
+        now = loop.time()
+        lag,last = min(lag+now-last,step*MAX_TICKS),now
+        if session.advantage()-peer.advantage >= 2 and session.tick >= wait:
+            lag -= step #Ahead of the remote; let it catch up a tick.
+            wait = session.tick+16
+        drew = False
+        while lag >= step:
+            if pilot:
+                pilot(local,Fighter.Players[1-side],rng)
+                word = replay.get_word(local)
+            else:
+                word = controls.BINDINGS[0].word(pg.key.get_pressed())
+            if session.local_tick <= session.tick+session.delay:
+                session.add_local(word)
+            if not session.advance(SURFACE if draw and lag < 2*step else None):
+                break
+            drew = draw
+            lag -= step
+        peer.send(session.packet(peer.ack))
+        if drew:
+            DIRTY.flush()
+        await asyncio.sleep(max(0.0,step-lag))
+    return session
+
+async def settle(peer,timeout=2.0):
+    """Keep exchanging input until everything sent has been acknowledged and
+    every remote tick up to ours is known, then fix the last mispredictions."""
+    session = peer.session
+    stop = asyncio.get_event_loop().time()+timeout
+    while asyncio.get_event_loop().time() < stop:
+        peer.send(session.packet(peer.ack))
+        if session.remote_tick >= session.tick and peer.ack >= session.local_tick:
+            break
+        await asyncio.sleep(0.01)
+    session.correct()
+
+async def selftest(ticks=640,latency=60.0,jitter=20.0,loss=0.05,port=47600,speed=1.0):
+    """Two headless peers with chase pilots over localhost.  Returns True if
+    both end in exactly the same state."""
+    from .batch import chase_policy #Importing batch forces headless mode.
+    host = await open_peer(True,("127.0.0.1",port),random.randrange(2**31),latency,jitter,loss)
+    join = await open_peer(False,("127.0.0.1",port+1),None,latency,jitter,loss)
+    async def play(peer,address):
+        session = await run_peer(peer,address,chase_policy,ticks,False,speed)
+        await settle(peer)
+        return session
+    sessions = await asyncio.gather(play(host,None),play(join,("127.0.0.1",port)))
+    for session in sessions:
+        print("side %d: %d ticks, %d rollbacks, %d ticks resimulated, %.3fms per resimulated tick"
+              % (session.side,session.tick,session.rollbacks,session.resimulated,
+                 1000*session.resim_time/max(session.resimulated,1)))
+    states = [session.Fighter.snapshot() for session in sessions]
+    host.transport.close()
+    join.transport.close()
+    same = states[0] == states[1]
+    print("in sync" if same else "DESYNC")
+    return same
+
+def parse_address(text,default="127.0.0.1"):
+    host,_,port = text.rpartition(":")
+    return (host or default,int(port))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Networked versus with rollback.")
+    parser.add_argument("mode",choices=("host","join","selftest"))
+    parser.add_argument("address",nargs="?",default="47600")
+    parser.add_argument("--latency",type=float,default=0.0,help="added one way delay (ms)")
+    parser.add_argument("--jitter",type=float,default=0.0,help="random extra delay (ms)")
+    parser.add_argument("--loss",type=float,default=0.0,help="chance of dropping a packet")
+    parser.add_argument("--ticks",type=int,default=640,help="selftest length")
+    args = parser.parse_args(argv)
+    if args.mode == "selftest":
+        same = asyncio.run(selftest(args.ticks,args.latency,args.jitter,args.loss))
+        return 0 if same else 1
+    async def play():
+        if args.mode == "host":
+            peer = await open_peer(True,parse_address(args.address,"0.0.0.0"),
+                                   random.randrange(2**31),args.latency,args.jitter,args.loss)
+            print("Waiting for a player to join...")
+            await run_peer(peer)
+        else:
+            peer = await open_peer(False,("0.0.0.0",0),None,args.latency,args.jitter,args.loss)
+            await run_peer(peer,parse_address(args.address))
+    asyncio.run(play())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Module: pilot.py
+Overview: Computer pilots.  Setting a Player's ai to a Pilot makes the Fight
+fly that ship instead of the keyboard.  A pilot plans its steering every few
+ticks by trying a handful of held control choices over a short horizon, using
+Ghosts: bare copies of the ships moved with the same rotate, translate, move
+and wrap code as a Body but with no images, masks or collisions.  Enemy shots
+are extrapolated in straight lines.  Planning stops when its time budget runs
+out and keeps the best choice so far, so a slow frame costs a worse plan
+rather than a dropped frame.  Firing is decided every tick from the intercept
+of a shot with the target.  The budget is what keeps pilots at frame rate,
+so planning stays on the simulation's own thread and every plan is in place
+for the tick it was made on.
+Classes: Ghost, Pilot
+Functions: intercept(shooter,target,speed), target(Player,Fighter),
+           threats(Player,Shots), preferred(Player), plan(...), rate(...)"""
+
+import math,time
+import numpy as np
+
+from . import bodies
+
+HORIZON = 24 #Ticks looked ahead when planning.
+#Candidate choices: turn (-1 left, 1 right), thrust (1 thrust, -1 reverse) and
+#how many ticks the turn is held for before flying straight.
+CHOICES = [(turn,thrust,hold) for thrust in (1,0,-1) for turn in (0,-1,1)
+           for hold in ((HORIZON,) if not turn else (HORIZON,HORIZON//3))]
+#Weights of the plan costs.
+RANGE_COST  = 1.0  #Straying from the preferred distance, per unit of that distance.
+AIM_COST    = 2.0  #Heading error at the end of the plan, per half turn.
+DANGER_COST = 4.0  #Each tick an enemy shot is within DANGER of the ship.
+CRASH_COST  = 1.0  #Each tick the ships are within CRASH of each other.
+DANGER = 28.0
+CRASH  = 55.0
+
+class Ghost:
+    """The motion state of a Body; stepping it runs the Body's own code."""
+    __slots__ = ("location","old_loc","vel_x","vel_y","angle","calc_angle","old_rot",
+                 "speed","accel","rot_speed","left","right","thrust","reverse","wrapped",
+                 "clock")
+    def __init__(self,Body):
+        for name in self.__slots__:
+            setattr(self,name,getattr(Body,name))
+        self.location = list(Body.location)
+
+    def copy(self):
+        ghost = Ghost.__new__(Ghost)
+        for name in self.__slots__:
+            setattr(ghost,name,getattr(self,name))
+        ghost.location = list(self.location)
+        return ghost
+
+    def controls(self,turn,thrust):
+        self.left,self.right = turn < 0,turn > 0
+        self.thrust,self.reverse = thrust > 0,thrust < 0
+
+    def step(self):
+        if self.left or self.right:
+            bodies.Body.rotate(self)
+        if self.thrust or self.reverse:
+            bodies.Body.translate(self)
+        bodies.Body.move_it(self)
+        bodies.Body.wrap_map(self)
+
+class Pilot:
+    """Flies one ship.  budget is the most milliseconds a plan may take (None
+    tries every choice, which is repeatable for batch runs), period is the
+    ticks between plans and phase offsets them so two pilots plan on
+    different ticks."""
+    def __init__(self,budget=1.0,period=4,phase=0):
+        self.budget = budget
+        self.period = period
+        self.phase = phase
+        self.plan = None #[(turn,thrust),...] for the ticks after self.planned.
+        self.planned = 0
+        self.best = CHOICES[0]
+        self.tries = 0 #Choices tried by the last plan.
+
+    def fly(self,Player,Fighter):
+        """Set Player's controls for the coming tick."""
+        enemy = target(Player,Fighter)
+        tick = Fighter.clock.ticks
+        if enemy is None:
+            Player.left = Player.right = Player.thrust = Player.reverse = False
+            Player.go_prime = Player.go_second = False
+            return
+        if not (tick-self.phase)%self.period or self.plan is None:
+            self.think((tick,Ghost(Player),Ghost(enemy),threats(Player,Fighter.Shots),
+                        preferred(Player),Player.shot_speed))
+        if self.plan:
+            turn,thrust = self.plan[min(tick-self.planned,len(self.plan)-1)]
+        else:
+            turn = thrust = 0
+        Player.left,Player.right = turn < 0,turn > 0
+        Player.thrust,Player.reverse = thrust > 0,thrust < 0
+        Player.go_prime = self.trigger(Player,enemy)
+        Player.go_second = False
+
+    def think(self,world):
+        tick,me,enemy,shots,distance,speed = world
+        deadline = time.perf_counter()+self.budget/1000.0 if self.budget else None
+        self.best,self.tries = plan(me,enemy,shots,distance,speed,self.best,deadline)
+        turn,thrust,hold = self.best
+        self.plan = [(turn if i < hold else 0,thrust) for i in range(HORIZON)]
+        self.planned = tick
+
+    def trigger(self,Player,enemy):
+        """Fire if the primary is ready and a shot fired now would meet the
+        enemy within range."""
+        if Player.energy < Player.prim_cost:
+            return False
+        if Player.clock.get_ticks()-Player.prime_time < 1000/Player.prime_speed:
+            return False
+        aim = intercept(Player,enemy,Player.shot_speed)
+        if not aim:
+            return False
+        ticks,x,y = aim
+        dist = math.hypot(x,y)
+        if math.hypot(x+Player.vel_x*ticks,y+Player.vel_y*ticks) > Player.shot_range:
+            return False
+        error = (math.degrees(math.atan2(y,x))-Player.calc_angle+180)%360-180
+        return abs(error) < max(3.0,math.degrees(math.atan2(18.0,dist)))
+
+################################################################################
+def intercept(shooter,target,speed):
+    """(ticks,x,y) where (x,y) is the direction shooter must face for a shot
+    fired now at speed (plus shooter's own velocity, as shots inherit it) to
+    meet target if it holds its velocity; None if it can't.  Wrapping is
+    ignored."""
+    dx = target.location[0]-shooter.location[0]
+    dy = target.location[1]-shooter.location[1]
+    wx = target.vel_x-shooter.vel_x
+    wy = target.vel_y-shooter.vel_y
+    a = wx*wx+wy*wy-speed*speed
+    b = 2*(dx*wx+dy*wy)
+    c = dx*dx+dy*dy
+    if abs(a) < 1e-9:
+        ticks = -c/b if b else -1
+    else:
+        root = b*b-4*a*c
+        if root < 0:
+            return None
+        root = math.sqrt(root)
+        ticks = min([t for t in ((-b-root)/(2*a),(-b+root)/(2*a)) if t > 0] or [-1])
+    if ticks <= 0:
+        return None
+    return ticks,dx+wx*ticks,dy+wy*ticks
+
+def target(Player,Fighter):
+    """The nearest other ship that is still alive, or None."""
+    best = None
+    for other in Fighter.Players:
+        if other is not Player and not other.dead and other.life > 0:
+            dist = math.hypot(other.location[0]-Player.location[0],
+                              other.location[1]-Player.location[1])
+            if best is None or dist < best[0]:
+                best = (dist,other)
+    return best[1] if best else None
+
+def threats(Player,Shots):
+    """Where each live shot not fired by Player will be over the horizon, as a
+    (HORIZON,n,2) array; shots that run out of range are moved far away."""
+    n = Shots.count
+    if not n:
+        return None
+    mine = Shots.owner_ids.get(Player,-1)
+    live = np.flatnonzero(Shots.origin[:n] != mine)
+    if not len(live):
+        return None
+    pos,vel = Shots.pos[live],Shots.vel[live]
+    left = Shots.range[live]-np.hypot(*(pos-Shots.start[live]).T)
+    steps = np.arange(1,HORIZON+1)[:,None]
+    path = pos+steps[:,:,None]*vel
+    gone = steps*np.hypot(*vel.T) >= left
+    path[gone] = 1e6
+    return path
+
+def preferred(Player):
+    """Distance to keep from the enemy: well inside weapon range."""
+    return max(80.0,0.6*Player.shot_range)
+
+def plan(me,enemy,shots,distance,speed,first=None,deadline=None):
+    """Try the CHOICES, first one first, and return the cheapest along with
+    how many were tried before deadline (a perf_counter time) passed.  The
+    enemy is assumed to keep its current controls."""
+    future = enemy.copy()
+    path = []
+    for i in range(HORIZON):
+        future.step()
+        path.append(tuple(future.location))
+    path = np.array(path)
+    order = [first]+[choice for choice in CHOICES if choice != first] if first else CHOICES
+    best,cheapest,tries = order[0],None,0
+    for choice in order:
+        if deadline and tries and time.perf_counter() > deadline:
+            break
+        cost = rate(me,choice,future,path,shots,distance,speed)
+        tries += 1
+        if cheapest is None or cost < cheapest:
+            best,cheapest = choice,cost
+    return best,tries
+
+def rate(me,choice,enemy,path,shots,distance,speed):
+    """Cost of flying choice over the horizon, given the enemy's path and
+    where it ends up."""
+    turn,thrust,hold = choice
+    ghost = me.copy()
+    ghost.controls(turn,thrust)
+    track = []
+    for i in range(HORIZON):
+        if i == hold:
+            ghost.controls(0,thrust)
+        ghost.step()
+        track.append(tuple(ghost.location))
+    track = np.array(track)
+    gap = np.hypot(*(path-track).T)
+    cost = RANGE_COST*np.abs(gap-distance).mean()/distance
+    cost += CRASH_COST*(gap < CRASH).sum()
+    if shots is not None:
+        near = ((shots-track[:,None,:])**2).sum(2) < DANGER*DANGER
+        cost += DANGER_COST*near.any(1).sum()
+    aim = intercept(ghost,enemy,speed)
+    if aim:
+        error = (math.degrees(math.atan2(aim[2],aim[1]))-ghost.calc_angle+180)%360-180
+        cost += AIM_COST*abs(error)/180.0
+    return cost
@@ -0,0 +1,230 @@
+"""Module: pipeline.py
+Overview: Optional pipelined fights.  The simulation runs headless in a
+second process at a steady FPS ticks a second and publishes a snapshot of the
+fight (see snapshot.py) after every tick into a ring buffer in shared memory.
+The game process only reads input and draws: each frame it restores the
+newest complete snapshot into a local copy of the fight and draws that, so
+slow drawing never delays a tick and the two halves can use different cores.
+Input words, pilot flags and replay save requests go the other way through a
+small control block in the same shared memory.  Fast-forward is not
+supported in this mode.  Set the environment variable HEGEMONY_PIPELINE=1 to
+use it.
+Classes: Ring, Simulation, Recording
+Functions: simulate(name,ships,stats,seed)
+Globals: ENABLED"""
+
+import multiprocessing,os,struct,time
+from multiprocessing import shared_memory
+
+from . import fight,pilot,replay,simclock
+from .globs import *
+from .profiler import PROFILE
+
+ENABLED = os.environ.get("HEGEMONY_PIPELINE","0") not in ("","0")
+
+LAYOUT  = struct.Struct("<II")      #Slot count and slot size.
+#Input word, pilot bits, run state (WAIT,RUN,STOP), save requests, save path.
+CONTROL = struct.Struct("<QBBI64s")
+WAIT,RUN,STOP = range(3)
+HEAD = struct.Struct("<Q")          #Sequence number of the newest frame.
+SLOT = struct.Struct("<QI")         #Sequence number and length of a frame.
+
+class Ring:
+    """Shared memory for one simulation process: the control block, written
+    by the game, and a ring of frames, written by the simulation.  Each slot's
+    sequence number is zeroed while it is written and set after, so a reader
+    can tell if a frame was overwritten while it was being copied (a seqlock).
+    Pass the name of an existing Ring to attach to it."""
+    def __init__(self,name=None,slots=4,size=1<<18):
+        if name:
+            self.memory = shared_memory.SharedMemory(name)
+            self.slots,self.size = LAYOUT.unpack_from(self.memory.buf)
+        else:
+            total = LAYOUT.size+CONTROL.size+HEAD.size+slots*(SLOT.size+size)
+            self.memory = shared_memory.SharedMemory(create=True,size=total)
+            self.slots,self.size = slots,size
+            LAYOUT.pack_into(self.memory.buf,0,slots,size)
+            CONTROL.pack_into(self.memory.buf,LAYOUT.size,0,0,WAIT,0,b"")
+            HEAD.pack_into(self.memory.buf,LAYOUT.size+CONTROL.size,0)
+        self.name = self.memory.name
+        self.owner = not name
+        self.head = LAYOUT.size+CONTROL.size
+        self.base = self.head+HEAD.size
+        self.published = 0
+        self.dropped = 0 #Frames too big for a slot.
+
+    def get_controls(self):
+        word,pilots,state,saves,path = CONTROL.unpack_from(self.memory.buf,LAYOUT.size)
+        return word,pilots,state,saves,path.rstrip(b"\0").decode("utf-8")
+
+    def set_controls(self,word,pilots,state,saves,path=""):
+        CONTROL.pack_into(self.memory.buf,LAYOUT.size,word,pilots,state,saves,
+                          path.encode("utf-8"))
+
+    def publish(self,data):
+        if len(data) > self.size:
+            self.dropped += 1
+            return
+        buf = self.memory.buf
+        self.published += 1
+        offset = self.base+(self.published%self.slots)*(SLOT.size+self.size)
+        SLOT.pack_into(buf,offset,0,len(data))
+        buf[offset+SLOT.size:offset+SLOT.size+len(data)] = data
+        SLOT.pack_into(buf,offset,self.published,len(data))
+        HEAD.pack_into(buf,self.head,self.published)
+
+    def latest(self,after=0):
+        """(sequence,bytes) of the newest intact frame newer than after, or None."""
+        buf = self.memory.buf
+        newest = HEAD.unpack_from(buf,self.head)[0]
+        for sequence in range(newest,max(after,newest-self.slots),-1):
+            offset = self.base+(sequence%self.slots)*(SLOT.size+self.size)
+            if SLOT.unpack_from(buf,offset)[0] != sequence:
+                continue
+            length = SLOT.unpack_from(buf,offset)[1]
+            data = bytes(buf[offset+SLOT.size:offset+SLOT.size+length])
+            if SLOT.unpack_from(buf,offset)[0] == sequence:
+                return sequence,data
+        return None
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+class Recording:
+    """Stands in for the fight's replay.Recorder; saving asks the simulation
+    process, which has the real one, to write the file."""
+    def __init__(self,Sim):
+        self.Sim = Sim
+
+    @property
+    def words(self):
+        return self.Sim.sequence > 0
+
+    def save(self,path):
+        self.Sim.saves += 1
+        self.Sim.path = path
+        self.Sim.send()
+        return path
+
+class Simulation:
+    """Stands in for a Fight in Control.  Input from the local copy's players
+    is sent to the simulation process and update draws the newest state it
+    has published.  The simulation waits for the first update to start."""
+    def __init__(self,ships=("BlueWing","Triple"),stats=None,seed=None):
+        self.Fighter = fight.Fight(simclock.SimClock(),stats,ships,seed)
+        self.Fighter.set_up()
+        self.recorder = Recording(self)
+        self.ring = Ring()
+        self.sequence = 0
+        self.word = 0
+        self.state = WAIT
+        self.saves = 0
+        self.path = ""
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(target=simulate,name="simulation",daemon=True,
+                                       args=(self.ring.name,self.Fighter.ships,
+                                             self.Fighter.stats,self.Fighter.seed))
+        #The child imports globs afresh; it must not open a window.
+        headless = os.environ.get("HEGEMONY_HEADLESS")
+        os.environ["HEGEMONY_HEADLESS"] = "1"
+        try:
+            self.process.start()
+        finally:
+            if headless is None:
+                del os.environ["HEGEMONY_HEADLESS"]
+            else:
+                os.environ["HEGEMONY_HEADLESS"] = headless
+
+    @property
+    def Players(self):
+        return self.Fighter.Players
+
+    @property
+    def done(self):
+        return self.Fighter.done
+
+    def fight_event(self,event):
+        self.Fighter.fight_event(event)
+
+    def send(self):
+        pilots = sum(1<<i for i,Player in enumerate(self.Players) if Player.ai)
+        self.ring.set_controls(self.word,pilots,self.state,self.saves,self.path)
+
+    def update(self,Surf):
+        """Send the current input and, if Surf is given, draw the newest state."""
+        if self.done:
+            self.close()
+            return
+        if self.state == WAIT:
+            self.state = RUN
+        self.word = replay.get_words(self.Players)
+        self.send()
+        if not Surf:
+            return
+        start = PROFILE.now()
+        frame = self.ring.latest(self.sequence)
+        if frame:
+            PROFILE.count("sim ticks",frame[0]-self.sequence)
+            self.sequence = frame[0]
+            self.Fighter.restore(frame[1])
+            #Keep local input as pressed, not as last simulated.
+            for i,Player in enumerate(self.Players):
+                if not Player.ai:
+                    replay.set_word(Player,self.word>>i*replay.BITS)
+        elif not self.process.is_alive():
+            raise RuntimeError("The simulation process has stopped.")
+        start = PROFILE.lap("pipeline.restore",start)
+        self.Fighter.draw(Surf)
+        PROFILE.lap("pipeline.draw",start)
+
+    def close(self):
+        """Stop the simulation process and free the shared memory."""
+        if self.process:
+            self.state = STOP
+            self.send()
+            self.process.join(1.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+            self.ring.close()
+
+################################################################################
+def simulate(name,ships,stats,seed):
+    """Body of the simulation process."""
+    Link = Ring(name)
+    Fighter = fight.Fight(simclock.SimClock(),stats,ships,seed)
+    Fighter.set_up()
+    Fighter.recorder = replay.Recorder()
+    step = simclock.TICK/1000.0
+    saves = 0
+    due = None
+    try:
+        while True:
+            word,pilots,state,requests,path = Link.get_controls()
+            if state == STOP:
+                break
+            if requests != saves:
+                saves = requests
+                Fighter.recorder.save(path)
+            if state == WAIT:
+                time.sleep(step)
+                continue
+            for i,Player in enumerate(Fighter.Players):
+                if pilots>>i&1:
+                    Player.ai = Player.ai or pilot.Pilot(phase=2*i)
+                else:
+                    Player.ai = None
+                    if not Player.sleep:
+                        replay.set_word(Player,word>>i*replay.BITS)
+            Fighter.update(None)
+            Link.publish(Fighter.snapshot())
+            now = time.perf_counter()
+            due = (due or now)+step
+            if due > now:
+                time.sleep(due-now)
+            elif now-due > MAX_TICKS*step:
+                due = now #Too far behind to catch up; drop the time.
+    finally:
+        Link.close()
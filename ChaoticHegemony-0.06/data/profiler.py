@@ -0,0 +1,155 @@
+"""Module: profiler.py
+Overview: Lightweight per-phase frame timing.  Phases are timed by passing
+the time returned from now() or the previous lap() to lap(), which stores the
+milliseconds spent in a ring buffer for that phase.  Counters are summed over a
+frame and stored the same way when frame() is called.  While disabled, now()
+and lap() do nothing but return 0, so the calls can stay in the main loop.
+Setting the environment variable HEGEMONY_PROFILE=1 enables it at start.
+Classes: Profiler
+Functions: percentile(values,q)
+Globals: PROFILE"""
+
+import csv,json,os,time
+from collections import deque
+import pygame as pg
+
+from . import assets
+from .globs import *
+from .render import DIRTY
+from .spritecache import SPRITES
+from .textcache import TEXT
+
+class Profiler:
+    """Ring buffers of the last size samples for each phase and counter.
+    Phase names are "owner.phase", eg. "fight.collide", and are shown in the
+    order they were first seen."""
+    def __init__(self,size=256):
+        self.size = size
+        self.enabled = os.environ.get("HEGEMONY_PROFILE","0") not in ("","0")
+        self.phases = {}
+        self.counters = {}
+        self.pending = {}
+        self.allocated = self.get_allocated()
+        #On-screen HUD, rebuilt a few times a second.
+        self.font = pg.font.Font(os.path.join(assets.ROOT,'graphics','Fixedsys500c.ttf'),16)
+        self.hud = None
+        self.hud_time = 0
+
+    def now(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def lap(self,name,start):
+        """Record the time since start under name and return the current time
+        so the next phase can be timed from it.  A start of 0.0 (taken while
+        the profiler was off) starts the timing without recording anything."""
+        if not self.enabled:
+            return 0.0
+        end = time.perf_counter()
+        if not start:
+            return end
+        try:
+            self.phases[name].append((end-start)*1000.0)
+        except KeyError:
+            self.phases[name] = deque([(end-start)*1000.0],self.size)
+        return end
+
+    def count(self,name,amount=1):
+        """Add amount to counter name for the current frame."""
+        if self.enabled:
+            self.pending[name] = self.pending.get(name,0)+amount
+
+    def gauge(self,name,value):
+        """Set counter name to value for the current frame."""
+        if self.enabled:
+            self.pending[name] = value
+
+    def get_allocated(self):
+        """Surfaces made by the sprite and text caches so far."""
+        return SPRITES.misses+TEXT.misses
+
+    def frame(self):
+        """End a frame; store each counter's total and start new ones."""
+        allocated = self.get_allocated()
+        if not self.enabled:
+            self.allocated = allocated
+            return
+        self.count("surfaces",allocated-self.allocated)
+        self.allocated = allocated
+        for name in self.counters:
+            self.pending.setdefault(name,0)
+        for name,amount in self.pending.items():
+            try:
+                self.counters[name].append(amount)
+            except KeyError:
+                self.counters[name] = deque([amount],self.size)
+        self.pending = {}
+
+    def clear(self):
+        self.phases.clear()
+        self.counters.clear()
+        self.pending = {}
+
+    def summary(self):
+        """{"phases":{name:stats},"counters":{name:stats}} where stats has the
+        last, mean, p50, p99 and max of the samples kept."""
+        def stats(samples):
+            values = list(samples)
+            return {"samples":len(values),"last":values[-1],
+                    "mean":sum(values)/float(len(values)),
+                    "p50":percentile(values,50),"p99":percentile(values,99),
+                    "max":max(values)}
+        return {"phases":{name:stats(samples) for name,samples in self.phases.items()},
+                "counters":{name:stats(samples) for name,samples in self.counters.items()}}
+
+    def export(self,path):
+        """Write the summary and raw samples to path as JSON, or the summary
+        alone as CSV if path ends in .csv."""
+        summary = self.summary()
+        if path.endswith(".csv"):
+            with open(path,"w",newline="") as out:
+                writer = csv.writer(out)
+                writer.writerow(("kind","name","samples","last","mean","p50","p99","max"))
+                for kind in ("phases","counters"):
+                    for name,stats in summary[kind].items():
+                        writer.writerow([kind[:-1],name]+[stats[key] for key in
+                                        ("samples","last","mean","p50","p99","max")])
+        else:
+            summary["samples"] = {name:list(samples) for name,samples in
+                                  list(self.phases.items())+list(self.counters.items())}
+            with open(path,"w") as out:
+                json.dump(summary,out,indent=1)
+        return path
+
+    def make_hud(self):
+        """Render the summary as a translucent panel."""
+        summary = self.summary()
+        lines = ["{:<18}{:>7}{:>7}{:>7}".format("phase ms","last","p50","p99")]
+        for name,stats in summary["phases"].items():
+            lines.append("{:<18}{last:7.2f}{p50:7.2f}{p99:7.2f}".format(name,**stats))
+        for name,stats in summary["counters"].items():
+            lines.append("{:<18}{last:7d}{p50:7.0f}{p99:7.0f}".format(name,**stats))
+        images = [self.font.render(line,False,(255,255,255)) for line in lines]
+        height = self.font.get_linesize()
+        width = max(image.get_width() for image in images)+8
+        hud = pg.Surface((width,height*len(images)+8),pg.SRCALPHA)
+        hud.fill((0,0,0,160))
+        for i,image in enumerate(images):
+            hud.blit(image,(4,4+i*height))
+        return hud
+
+    def draw(self,Surface,location=(OFFSET[0]+4,4)):
+        """Blit the HUD, refreshing its numbers four times a second."""
+        if not self.phases:
+            return
+        if not self.hud or pg.time.get_ticks()-self.hud_time > 250:
+            self.hud = self.make_hud()
+            self.hud_time = pg.time.get_ticks()
+        DIRTY.add(Surface.blit(self.hud,location))
+
+################################################################################
+def percentile(values,q):
+    """Nearest rank percentile of a list of numbers."""
+    values = sorted(values)
+    return values[min(int(round(q/100.0*(len(values)-1))),len(values)-1)]
+
+PROFILE = Profiler()
@@ -0,0 +1,294 @@
+"""Module: projectiles.py
+Overview: Batched weapons fire.  Every live shot is a row in a set of NumPy
+arrays rather than its own Body, so moving, expiring, wrapping and hit testing
+thousands of shots is a handful of array operations per frame.  Hit tests are
+swept: rects are compared along each shot's path over the tick, and where
+they meet but the masks don't overlap at the end of it, the path is searched
+(see sweep.py) so fast shots can't pass through thin targets.
+Classes: Projectiles
+Functions: wrap_map(loc), to_screen(loc,maprect,extra,zoom)"""
+
+import math
+import numpy as np
+
+from . import sweep
+from .globs import *
+from .spritecache import SPRITES
+from .render import DIRTY
+
+class Projectiles:
+    """Struct-of-arrays store for all shots on the map.  Only the first
+    self.count rows of each array are live; rows are kept in firing order.
+    Shots can't hit the ship that fired them (hit_origin) and shots from the
+    same ship don't hit each other (hit_self).  Shots from different ships
+    destroy each other on contact."""
+    def __init__(self,capacity=256):
+        self.count = 0
+        self.hit_origin = False
+        self.hit_self   = False
+        self.allocate(capacity)
+
+        #Ships that have fired; origin column indexes into this.
+        self.owners = []
+        self.owner_ids = {}
+        #Distinct (image,angle slot) pairs; sprite column indexes into this.
+        self.sprites = []
+        self.sprite_ids = {}
+        self.sprite_zoom = None
+        self.images = []
+        self.masks  = []
+        self.sizes  = np.zeros((0,2),int)
+        self.solids = np.zeros((0,4),int) #(x,y,w,h) of each mask's set bits.
+
+        #Screen rects of live shots as of the last call to locate, how far
+        #each moved on the screen in the last update (nothing if it wrapped)
+        #and (left,top,right,bottom) of rects covering the set bits of their
+        #masks all along that motion.
+        self.rects = np.zeros((0,4),int)
+        self.motion = np.zeros((0,2))
+        self.swept = np.zeros((0,4))
+
+    def allocate(self,capacity):
+        """(Re)size all buffers keeping live rows."""
+        def grow(old,shape,dtype):
+            new = np.zeros(shape,dtype)
+            if old is not None:
+                new[:self.count] = old[:self.count]
+            return new
+        get = lambda name: getattr(self,name,None)
+        self.capacity = capacity
+        self.pos    = grow(get("pos"),(capacity,2),float)
+        self.vel    = grow(get("vel"),(capacity,2),float)
+        self.start  = grow(get("start"),(capacity,2),float)
+        self.range  = grow(get("range"),capacity,float)
+        self.damage = grow(get("damage"),capacity,float)
+        self.origin = grow(get("origin"),capacity,np.int32)
+        self.sprite = grow(get("sprite"),capacity,np.int32)
+        self.done   = grow(get("done"),capacity,bool)
+
+    def __len__(self):
+        return self.count
+
+    def get_owner(self,ship):
+        if ship not in self.owner_ids:
+            self.owner_ids[ship] = len(self.owners)
+            self.owners.append(ship)
+        return self.owner_ids[ship]
+
+    def get_sprite(self,image,angle):
+        key = (image,SPRITES.quantize(angle))
+        if key not in self.sprite_ids:
+            self.sprite_ids[key] = len(self.sprites)
+            self.sprites.append((image,angle))
+            self.sprite_zoom = None
+        return self.sprite_ids[key]
+
+    def add(self,origin,image,rnge=100,damage=1,speed=3.0):
+        """Fire a shot from origin along its heading; the ship's own velocity
+        is added to the shot's."""
+        if self.count == self.capacity:
+            self.allocate(self.capacity*2)
+        i = self.count
+        ang = math.radians(origin.calc_angle)
+        self.pos[i] = self.start[i] = origin.location
+        self.vel[i] = (origin.vel_x+speed*math.cos(ang),origin.vel_y+speed*math.sin(ang))
+        self.range[i] = rnge
+        self.damage[i] = damage
+        self.origin[i] = self.get_owner(origin)
+        self.sprite[i] = self.get_sprite(image,origin.angle)
+        self.done[i] = False
+        self.count += 1
+
+    def set_zoom(self,zoom):
+        """Look up images, masks and sizes for every sprite at zoom."""
+        if self.sprite_zoom != zoom or len(self.images) != len(self.sprites):
+            entries = [SPRITES.get(image,angle,zoom) for image,angle in self.sprites]
+            self.images = [entry[0] for entry in entries]
+            self.masks  = [entry[2] for entry in entries]
+            self.sizes  = np.array([entry[1].size for entry in entries],int).reshape(-1,2)
+            self.solids = np.array([tuple(sweep.solid(mask) or (0,0,0,0)) for mask in self.masks],
+                                   int).reshape(-1,4)
+            self.sprite_zoom = zoom
+
+    def update(self,maprect,extra,zoom,dt=1.0):
+        """Advance every shot one frame, wrap them around the map, flag those
+        that have exceeded their range, and find their screen rects.  dt is
+        the length of the frame in TICKs; velocities are per TICK."""
+        n = self.count
+        if not n:
+            self.clear()
+            return
+        pos = self.pos[:n]
+        moved = self.vel[:n]*dt
+        pos += moved
+        W,H = ARENA
+        out = (pos[:,0] < 0)|(pos[:,0] > W)|(pos[:,1] < 0)|(pos[:,1] > H)
+        if out.any():
+            pos[out] = wrap_map(pos[out])
+            moved[out] = 0
+        dist = np.hypot(*(pos-self.start[:n]).T)
+        self.done[:n] |= dist >= self.range[:n]
+        self.locate(maprect,extra,zoom)
+        self.motion = moved*(4.0/zoom)
+        solid = self.solids[self.sprite[:n]]
+        end = self.rects[:,:2]+solid[:,:2]
+        start = end-self.motion
+        self.swept = np.hstack((np.minimum(end,start)-1,
+                                np.maximum(end,start)+solid[:,2:]+1))
+
+    def locate(self,maprect,extra,zoom,pos=None):
+        """Screen rects (x,y,w,h) of all live shots, or of them at pos,
+        rounded the same way pg.Rect rounds a float center."""
+        n = self.count
+        self.set_zoom(zoom)
+        size = self.sizes[self.sprite[:n]]
+        center = to_screen(self.pos[:n] if pos is None else pos,maprect,extra,zoom)
+        center = np.trunc(center+np.copysign(0.5,center)).astype(int)
+        self.rects = np.hstack((center-size//2,size))
+
+    def check_collissions(self,ships):
+        """Damage ships hit by shots, and destroy shots that hit each other.
+        The rects of the set bits of shots' masks are compared in bulk, swept
+        along each shot's motion, so nearly all misses are found without a
+        Python loop.  Shots whose rects overlap at the end of the tick
+        get a mask test there; the path of any that don't hit is searched.
+        Returns the number of mask tests made."""
+        n = self.count
+        if not n:
+            return 0
+        tests = 0
+        x,y,w,h = self.rects.T
+        mx,my = self.motion.T
+        left,top,right,bottom = self.swept.T
+        origin = self.origin[:n]
+        for ship in ships:
+            rect = ship.rect
+            bounds = ship.get_swept()
+            near = (left < bounds.right)&(right > bounds.left)&(top < bounds.bottom)&(bottom > bounds.top)
+            if not self.hit_origin and ship in self.owner_ids:
+                near &= origin != self.owner_ids[ship]
+            if not near.any():
+                continue
+            sx,sy = ship.get_motion()
+            for i in np.flatnonzero(near).tolist():
+                offset = (int(x[i])-rect.x,int(y[i])-rect.y)
+                mask = self.masks[self.sprite[i]]
+                hit = False
+                if x[i] < rect.right and x[i]+w[i] > rect.left and y[i] < rect.bottom and y[i]+h[i] > rect.top:
+                    tests += 1
+                    hit = ship.mask.overlap(mask,offset)
+                if not hit:
+                    #Shot motion relative to the ship.
+                    hit,more = sweep.contact(ship.mask,mask,offset,(mx[i]-sx,my[i]-sy))
+                    tests += more
+                if hit:
+                    if ship.life > 0:
+                        ship.life -= self.damage[i].item()
+                    self.done[i] = True
+        for i,j in self.candidate_pairs():
+            offset = (int(x[j]-x[i]),int(y[j]-y[i]))
+            mask,other = self.masks[self.sprite[i]],self.masks[self.sprite[j]]
+            hit = False
+            if x[i] < x[j]+w[j] and x[j] < x[i]+w[i] and y[i] < y[j]+h[j] and y[j] < y[i]+h[i]:
+                tests += 1
+                hit = mask.overlap(other,offset)
+            if not hit:
+                hit,more = sweep.contact(mask,other,offset,(mx[j]-mx[i],my[j]-my[i]))
+                tests += more
+            if hit:
+                self.done[i] = self.done[j] = True
+        return tests
+
+    def candidate_pairs(self):
+        """Pairs of shots whose swept rects (covering their motion over the
+        tick) overlap, found by sorting one group of shots along x and
+        searching it for each shot of the other group.  Unless hit_self, only
+        groups from different ships are compared."""
+        n = self.count
+        if n < 2:
+            return []
+        everything = np.arange(n)
+        if self.hit_self:
+            groups = [(everything,everything)]
+        else:
+            origin = self.origin[:n]
+            ids = [everything[origin == k] for k in range(len(self.owners))]
+            groups = [(ids[a],ids[b]) for a in range(len(ids)) for b in range(a+1,len(ids))]
+        x,y,right,bottom = self.swept.T
+        w,h = right-x,bottom-y
+        pairs = []
+        for a,b in groups:
+            if not len(a) or not len(b):
+                continue
+            same = a is b
+            b = b[np.argsort(x[b],kind="stable")]
+            xb = x[b]
+            lo = np.searchsorted(xb,x[a]-w[b].max(),"right")
+            hi = np.searchsorted(xb,x[a]+w[a],"left")
+            reach = np.maximum(hi-lo,0)
+            total = reach.sum()
+            if not total:
+                continue
+            i = np.repeat(a,reach)
+            j = b[np.repeat(lo,reach)+np.arange(total)-np.repeat(np.cumsum(reach)-reach,reach)]
+            keep = (x[i] < x[j]+w[j])&(y[j] < y[i]+h[i])&(y[i] < y[j]+h[j])
+            if same:
+                keep &= i < j
+            pairs.extend(zip(i[keep].tolist(),j[keep].tolist()))
+        return pairs
+
+    def draw(self,Surface,maprect,extra,zoom,back=0.0):
+        """Blit all live shots, each moved back along its velocity by back
+        ticks (to draw between ticks) unless that takes it off the map."""
+        n = self.count
+        if not n:
+            return
+        if back:
+            pos = self.pos[:n]-self.vel[:n]*back
+            W,H = ARENA
+            out = (pos[:,0] < 0)|(pos[:,0] > W)|(pos[:,1] < 0)|(pos[:,1] > H)
+            pos[out] = self.pos[:n][out]
+            self.locate(maprect,extra,zoom,pos)
+        else:
+            self.locate(maprect,extra,zoom)
+        images = self.images
+        spots = (self.rects[:,:2]+OFFSET).tolist()
+        DIRTY.extend(Surface.blits([(images[s],spot) for s,spot in zip(self.sprite[:self.count].tolist(),spots)]))
+
+    def remove_done(self):
+        """Drop finished shots, keeping the rest in firing order."""
+        n = self.count
+        keep = np.flatnonzero(~self.done[:n])
+        if len(keep) == n:
+            return
+        for name in ("pos","vel","start","range","damage","origin","sprite","done"):
+            array = getattr(self,name)
+            array[:len(keep)] = array[keep]
+        self.count = len(keep)
+
+    def clear(self):
+        self.count = 0
+        self.rects = np.zeros((0,4),int)
+        self.motion = np.zeros((0,2))
+        self.swept = np.zeros((0,4))
+
+################################################################################
+def wrap_map(loc):
+    """Vectorized version of bodies.Body.wrap_map for an (n,2) array."""
+    x,y = loc[:,0],loc[:,1]
+    W,H = ARENA
+    left,right = x < 0,x > W
+    side = left|right
+    x = np.where(left,W,np.where(right,0,x))
+    y = np.where(side,np.where(y < 0,H,np.where(y > H,0,H-y)),y)
+    top,bottom = y < 0,y > H
+    x = np.where(top|bottom,W-x,x)
+    y = np.where(top,H,np.where(bottom,0,y))
+    return np.column_stack((x,y))
+
+def to_screen(loc,maprect,extra,zoom):
+    """Vectorized version of bodies.Body.position; map to screen coordinates."""
+    if zoom == 4.0:
+        return loc.copy()
+    scale = 4.0/zoom
+    return (loc-(maprect.x,maprect.y))*scale+extra
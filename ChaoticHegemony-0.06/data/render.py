@@ -0,0 +1,57 @@
+"""Module: render.py
+Overview: Dirty rectangle bookkeeping so only the parts of the screen that
+changed are pushed to the display each frame.
+Classes: DirtyRects
+Globals: DIRTY"""
+
+import pygame as pg
+
+from .globs import *
+
+class DirtyRects:
+    """Drawables add the screen rects they touch during a frame, and flush
+    updates the display with just those.  Anything that changes the whole
+    screen (scrolling, zooming, scene changes) calls invalidate instead, which
+    makes the next flush a full update.  Rects drawn over the background in
+    the previous frame are kept in last so it can be restored underneath them."""
+    def __init__(self,limit=64):
+        self.limit = limit #Above this many rects a full update is cheaper.
+        self.screen = pg.Rect((0,0),SCREENSIZE)
+        self.rects = [] #Everything to push to the display this frame.
+        self.drawn = [] #Just the rects drawn over the background.
+        self.last  = []
+        self.full  = True
+
+    def add(self,rect,restore=True):
+        """Report a changed rect.  Pass restore=False for background that was
+        itself just restored, so it isn't restored again next frame."""
+        rect = self.screen.clip(rect)
+        if rect.width and rect.height:
+            self.rects.append(rect)
+            if restore:
+                self.drawn.append(rect)
+
+    def extend(self,rects):
+        for rect in rects:
+            self.add(rect)
+
+    def invalidate(self):
+        self.full = True
+
+    def touches(self,rect):
+        """True if rect must be redrawn this frame; something was drawn over it
+        either this frame or last frame, or the whole screen is being redrawn."""
+        return self.full or rect.collidelist(self.drawn) != -1 or rect.collidelist(self.last) != -1
+
+    def flush(self):
+        """Push this frame's changes to the display."""
+        if self.full or len(self.rects) > self.limit:
+            pg.display.update()
+        elif self.rects:
+            pg.display.update(self.rects)
+        self.last = self.drawn
+        self.rects = []
+        self.drawn = []
+        self.full = False
+
+DIRTY = DirtyRects()
@@ -0,0 +1,180 @@
+"""Module: replay.py
+Overview: Match recording and deterministic playback.  The only things that
+differ between two fights are the players' six control flags, so a match is
+stored as one input word per simulation tick (six bits per player; 16 bit
+words for two players, 64 bit for more), zlib compressed, plus the seed, ship choices and stat overrides needed to set
+the fight up again.  State keyframes are saved periodically so playback can
+seek without simulating from the start.  Play a file from the game directory:
+    python -m data.replay FILE [--speed 0] [--seek TICK] [--headless]
+Classes: Recorder, Replay
+Functions: get_word(Player), set_word(Player,word), get_words(Players),
+           set_words(Players,word), word_type(players), main(argv=None)"""
+
+import os,sys
+if __name__ == "__main__" and "--headless" in sys.argv:
+    os.environ.setdefault("HEGEMONY_HEADLESS","1") #Must happen before globs is imported.
+
+import argparse,json,struct,time,zlib
+import numpy as np
+import pygame as pg
+
+from . import fight,simclock
+from .controls import ACTIONS #Player flags in input word bit order.
+from .globs import *
+from .render import DIRTY
+
+MAGIC = b"KHREPLY2"
+BITS = len(ACTIONS)
+
+class Recorder:
+    """Collects a fight's input words as it is played.  Set as a Fight's
+    recorder and it is called at the start of every tick.  A snapshot is kept
+    as a keyframe every interval ticks."""
+    def __init__(self,interval=256):
+        self.interval = interval
+        self.header = None
+        self.words = []
+        self.keyframes = []
+
+    def record(self,Fighter):
+        if not self.header:
+            self.header = {"seed":Fighter.seed,"ships":Fighter.ships,
+                           "stats":Fighter.stats,"fps":FPS,"interval":self.interval}
+        tick = Fighter.clock.ticks
+        if not tick%self.interval:
+            self.keyframes.append((tick,Fighter.snapshot()))
+        self.words.append(get_words(Fighter.Players))
+
+    def save(self,path):
+        """Write the replay file.  Layout is MAGIC, header length, JSON header,
+        compressed input words, then each compressed keyframe."""
+        inputs = zlib.compress(np.array(self.words,word_type(len(self.header["ships"]))).tobytes(),9)
+        frames = [zlib.compress(state,9) for tick,state in self.keyframes]
+        offset = len(inputs)
+        index = []
+        for (tick,state),blob in zip(self.keyframes,frames):
+            index.append([tick,offset,len(blob)])
+            offset += len(blob)
+        header = dict(self.header,ticks=len(self.words),inputs=[0,len(inputs)],keyframes=index)
+        header = json.dumps(header).encode("utf-8")
+        with open(path,"wb") as out:
+            out.write(MAGIC+struct.pack("<I",len(header))+header+inputs)
+            for blob in frames:
+                out.write(blob)
+        return path
+
+class Replay:
+    """A loaded replay file.  fight() sets up a fresh Fight the way the
+    recorded one was, and step() plays it forward a tick at a time."""
+    def __init__(self,path):
+        with open(path,"rb") as replay:
+            data = replay.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a replay file: {}".format(path))
+        length = struct.unpack_from("<I",data,len(MAGIC))[0]
+        start = len(MAGIC)+4
+        self.header = json.loads(data[start:start+length].decode("utf-8"))
+        self.data = data[start+length:]
+        begin,size = self.header["inputs"]
+        self.words = np.frombuffer(zlib.decompress(self.data[begin:begin+size]),
+                                   word_type(len(self.header["ships"]))).tolist()
+        self.keyframes = [tuple(entry) for entry in self.header["keyframes"]]
+
+    def __len__(self):
+        return len(self.words)
+
+    def fight(self):
+        header = self.header
+        Fighter = fight.Fight(simclock.SimClock(),[dict(stats) for stats in header["stats"]],
+                              header["ships"],header["seed"])
+        Fighter.set_up()
+        for Player in Fighter.Players:
+            Player.ai = None #Computer pilots' input was recorded too.
+        return Fighter
+
+    def done(self,Fighter):
+        return Fighter.clock.ticks >= len(self.words)
+
+    def step(self,Fighter,Surf=None):
+        """Apply the recorded input for the next tick and simulate it."""
+        set_words(Fighter.Players,self.words[Fighter.clock.ticks])
+        Fighter.update(Surf)
+
+    def keyframe(self,tick):
+        """(tick,snapshot) of the last keyframe at or before tick, or None."""
+        best = None
+        for entry in self.keyframes:
+            if entry[0] <= tick:
+                best = entry
+        if not best:
+            return None
+        tick,offset,size = best
+        return tick,zlib.decompress(self.data[offset:offset+size])
+
+    def seek(self,Fighter,tick):
+        """Move to tick by restoring the nearest keyframe before it (unless
+        Fighter is already closer) then simulating the rest.  Returns the
+        Fighter, which is a new one when seeking backwards."""
+        tick = min(tick,len(self.words))
+        if Fighter.clock.ticks > tick:
+            Fighter = self.fight()
+        keyframe = self.keyframe(tick)
+        if keyframe and keyframe[0] > Fighter.clock.ticks:
+            Fighter.restore(keyframe[1])
+        while Fighter.clock.ticks < tick:
+            self.step(Fighter)
+        return Fighter
+
+################################################################################
+def get_word(Player):
+    """Pack a player's control flags into an int."""
+    word = 0
+    for bit,action in enumerate(ACTIONS):
+        if getattr(Player,action):
+            word |= 1<<bit
+    return word
+
+def set_word(Player,word):
+    for bit,action in enumerate(ACTIONS):
+        setattr(Player,action,bool(word>>bit&1))
+
+def get_words(Players):
+    """Every player's control flags in one int, player one lowest."""
+    word = 0
+    for i,Player in enumerate(Players):
+        word |= get_word(Player)<<i*BITS
+    return word
+
+def set_words(Players,word):
+    for i,Player in enumerate(Players):
+        set_word(Player,word>>i*BITS)
+
+def word_type(players):
+    """numpy type of the stored input words for a fight between players ships."""
+    return "<u2" if players <= 2 else "<u8"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play back a recorded match.")
+    parser.add_argument("path")
+    parser.add_argument("--speed",type=float,default=1.0,help="playback speed; 0 is uncapped")
+    parser.add_argument("--seek",type=int,default=0,help="start at this tick")
+    parser.add_argument("--headless",action="store_true",help="simulate without drawing")
+    args = parser.parse_args(argv)
+    Playback = Replay(args.path)
+    Fighter = Playback.seek(Playback.fight(),args.seek)
+    begin = time.time()
+    clock = pg.time.Clock()
+    while not Playback.done(Fighter):
+        if SURFACE and not args.headless:
+            for event in pg.event.get():
+                if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
+                    return
+            Playback.step(Fighter,SURFACE)
+            DIRTY.flush()
+            clock.tick(FPS*args.speed if args.speed else 0)
+        else:
+            Playback.step(Fighter)
+    print("%d ticks in %.2fs, winner: %s" % (len(Playback)-args.seek,time.time()-begin,Fighter.victory))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Module: scenes.py
+Overview: Keeps the title screen and the fight alive between matches rather
+than rebuilding them.  The title is reset in place when a fight ends, and the
+next fight is made straight away.  While the title shows, a worker thread
+renders what the fight's first frames will need: the ships' rotations at and
+around the zoom the camera opens on, the background tiles in view, and the
+stat bar parts.  It works on a throwaway copy of the fight, so the real one
+is untouched, and the caches it fills are locked.  The fight is set up once
+that is done, on a title frame, and only then may the title hand over to it,
+so the switch costs no more than an ordinary frame.
+Classes: Scenes
+Functions: warm(ships)"""
+
+import threading
+
+from . import fight,pipeline,replay,simclock,title
+from .globs import *
+from .spritecache import SPRITES
+
+TURN = 30 #Degrees either side of each ship's starting angle to render.
+
+class Scenes:
+    """The game's scenes.  Titler is the title screen and Fighter the next
+    (or current) fight."""
+    def __init__(self):
+        self.Titler = None
+        self.Fighter = None
+        self.worker = None
+        self.show_title()
+
+    def show_title(self):
+        """Show the title (reset, if there already is one) and prepare a new
+        fight behind it."""
+        if self.Titler:
+            self.Titler.reset()
+        else:
+            self.Titler = title.Title()
+        ships = fight.lineup(PLAYERS)
+        if pipeline.ENABLED:
+            self.Fighter = pipeline.Simulation(ships)
+        else:
+            self.Fighter = fight.Fight(ships=ships)
+            self.Fighter.recorder = replay.Recorder()
+        self.worker = threading.Thread(target=warm,args=(ships,),
+                                       name="prewarm",daemon=True)
+        self.worker.start()
+
+    def ready(self):
+        """Whether the fight can start without a hitch.  Sets it up once the
+        worker is done; call it on title frames."""
+        if self.worker:
+            if self.worker.is_alive():
+                return False
+            self.worker = None
+            if not pipeline.ENABLED:
+                self.Fighter.set_up()
+        return True
+
+    def wait(self):
+        """Block until the fight is ready."""
+        if self.worker:
+            self.worker.join()
+        return self.ready()
+
+################################################################################
+def warm(ships):
+    """Render what the first frames of a fight between ships will use, by
+    setting up a copy of it and pointing its camera."""
+    Fighter = fight.Fight(simclock.SimClock(),ships=ships,seed=0)
+    Fighter.set_up()
+    Starmap = Fighter.Starmap
+    Starmap.update()
+    zooms = Starmap.zooms
+    level = zooms.index(Starmap.zoom)
+    for zoom in zooms[max(level-1,0):level+2]:
+        for Player in Fighter.Players:
+            for turn in range(-TURN,TURN+1,max(1,int(SPRITES.step))):
+                SPRITES.get(Player.initial,Player.angle+turn,zoom)
+    for Statbar in Fighter.Statbars:
+        Statbar.update()
+    if Starmap.tiles:
+        area = Starmap.get_area()
+        for key in Starmap.tiles.keys(area,Starmap.zoom):
+            Starmap.tiles.get(*key)
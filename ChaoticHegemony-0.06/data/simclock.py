@@ -0,0 +1,32 @@
+"""Module: simclock.py
+Overview: Virtual simulation clock advanced by a fixed step each tick.
+All game timers (fire rate, regen, animations, countdowns) read one of these
+instead of the wall clock so the game plays identically at any frame rate.
+Classes: SimClock
+Globals: CLOCK"""
+
+from .globs import *
+
+TICK = 1000/FPS #Milliseconds of game time per simulation tick.
+
+class SimClock:
+    """Counts simulation ticks.  get_ticks mirrors pg.time.get_ticks but
+    returns elapsed game time in milliseconds."""
+    def __init__(self,step=TICK):
+        self.step = step
+        self.ticks = 0
+        self.time = 0.0
+
+    def tick(self):
+        """Advance the clock by a single simulation step."""
+        self.ticks += 1
+        self.time = self.ticks*self.step
+
+    def get_ticks(self):
+        return self.time
+
+    def reset(self):
+        self.ticks = 0
+        self.time = 0.0
+
+CLOCK = SimClock() #Default clock for bodies not owned by a fight.
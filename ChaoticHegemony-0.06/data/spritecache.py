@@ -0,0 +1,77 @@
+"""Module: spritecache.py
+Overview: Shared cache of pre-rendered sprite rotations and their masks.
+Classes: SpriteCache
+Globals: SPRITES"""
+
+import threading
+from collections import OrderedDict
+import pygame as pg
+
+class SpriteCache:
+    """Holds rotated and scaled copies of source images together with their
+    masks.  Entries are keyed by (source image, quantized angle, zoom) and
+    evicted least recently used first once max_size is exceeded.
+    Cached images and masks are shared between bodies; never draw on them.
+    Lookups are locked so a worker thread can fill the cache ahead of time."""
+    def __init__(self,max_size=4096,step=1.0):
+        self.max_size = max_size
+        self.step = float(step) #Angle quantization in degrees.
+        self.slots = int(round(360/self.step))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.blanks = {} #size -> empty mask, for dead bodies.
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self,angle):
+        """Slot number for angle; equivalent rotations share a slot."""
+        return int(round(angle/self.step))%self.slots
+
+    def key(self,initial,angle,zoom):
+        return (initial,self.quantize(angle),zoom)
+
+    def get(self,initial,angle,zoom):
+        """Return (image,rect,mask) for initial rotated by angle at zoom.
+        The returned rect is positioned at the origin; copy it before moving."""
+        key = self.key(initial,angle,zoom)
+        with self.lock:
+            try:
+                entry = self.entries[key]
+                self.entries.move_to_end(key)
+                self.hits += 1
+            except KeyError:
+                entry = self.render(*key)
+                self.entries[key] = entry
+                self.misses += 1
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def render(self,initial,slot,zoom):
+        """Create a single cache entry.  This is the only place sprites are
+        actually scaled, rotated, and scanned for masks."""
+        size = (int(initial.get_width()//zoom),int(initial.get_height()//zoom))
+        image = pg.transform.rotate(pg.transform.scale(initial,size),slot*self.step)
+        return image,image.get_rect(),pg.mask.from_surface(image)
+
+    def blank(self,size):
+        """An empty mask of size, made once per size and shared."""
+        try:
+            return self.blanks[size]
+        except KeyError:
+            mask = self.blanks[size] = pg.mask.Mask(size)
+            return mask
+
+    def prerender(self,initial,zooms=(1.0,2.0,4.0),angles=None):
+        """Fill the cache ahead of time for an image.  By default every
+        quantized angle is rendered at each zoom level."""
+        if angles is None:
+            angles = [slot*self.step for slot in range(self.slots)]
+        for zoom in zooms:
+            for angle in angles:
+                self.get(initial,angle,zoom)
+
+    def clear(self):
+        self.entries.clear()
+
+SPRITES = SpriteCache()
@@ -1,21 +1,35 @@
 """Module: starmap.py
 Overview: The processing for the map scrolling and background.
-Classes: StarMap"""
+Classes: StarMap
+Globals: MARGIN"""
 
 import math
 import pygame as pg
 
+from . import tiles
 from .globs import *
+from .render import DIRTY
+
+MARGIN = 40.0 #World pixels kept clear around the ships by the smooth camera.
 
 class StarMap:
-    """Combat map for two players.  Controls zoom changes and scrolling
-    background logic."""
-    def __init__(self,background,Players):
+    """Combat map for any number of players.  Controls zoom changes and
+    scrolling background logic.  zooms is the ladder of zoom levels the camera
+    picks from; a fine ladder (SMOOTH_ZOOMS) makes it glide between levels."""
+    def __init__(self,background,Players,zooms=ZOOMS):
         self.bg = background
-        self.sector = None
-        self.P1 = Players[0]
-        self.P2 = Players[1]
-        self.zoom = 4.0
+        #Background tiles for each zoom level; never drawn when headless.
+        self.tiles = None if HEADLESS else tiles.get_background(background)
+        self.view = None #Camera as of the last full background draw.
+        self.backdrop = None #The view in one surface, for restoring small areas quickly.
+        self.backdrop_view = None
+        self.Players = tuple(Players)
+        self.zooms = tuple(zooms)
+        self.smooth = self.zooms != ZOOMS
+        #The smooth camera moves on from the zoom it has, which is always the
+        #zoom the ships were last set to; start at the one they were made at.
+        zoom = self.Players[0].zoom
+        self.zoom = zoom if zoom in self.zooms else self.zooms[-1]
 
         self.center = (0,0)
         self.max_x = 0
@@ -24,121 +38,141 @@ class StarMap:
         self.rect = pg.Rect((0,0),PLAYSIZE)
         self.extra = 0,0
 
-        self.collide_objects = [self.P1,self.P2] #list of objects on the map that can collide
+        self.collide_objects = list(self.Players) #list of objects on the map that can collide
+
+    def tracked(self):
+        """The ships the camera keeps in view; those whose explosions aren't
+        over yet, or all of them once none are left."""
+        return [Player for Player in self.Players if Player.dead_frame != 5] or self.Players
 
     def get_distance(self):
-        """component distance of the players"""
-        self.max_x = (max(self.P1.location[0],self.P2.location[0])
-                     -min(self.P1.location[0],self.P2.location[0]))
-        self.max_y = (max(self.P1.location[1],self.P2.location[1])
-                     -min(self.P1.location[1],self.P2.location[1]))
+        """Bounding box of the tracked ships; its size and center."""
+        ships = self.tracked()
+        xs = [Player.location[0] for Player in ships]
+        ys = [Player.location[1] for Player in ships]
+        left,top = min(xs),min(ys)
+        self.max_x = max(xs)-left
+        self.max_y = max(ys)-top
+        self.center = left+self.max_x/2.0,top+self.max_y/2.0
 
     def get_center(self):
-        """Finds the point in the middle of the two players.  This will be the
-        center of the screen unless one of the players is near an edge."""
-        if not self.P1.dead and self.P2.dead_frame == 5:
-            centerx,centery = self.P1.location
-        elif self.P1.dead_frame == 5 and not self.P2.dead:
-            centerx,centery = self.P2.location
-        else:
-            centerx = min(self.P1.location[0],self.P2.location[0])+self.max_x/2.0
-            centery = min(self.P1.location[1],self.P2.location[1])+self.max_y/2.0
-        if self.zoom == 1.0:
-            if centerx < PLAYSIZE[0]/8: centerx = PLAYSIZE[0]/8
-            elif centerx > PLAYSIZE[0]-PLAYSIZE[0]/8: centerx = PLAYSIZE[0]-PLAYSIZE[0]/8
-            if centery < PLAYSIZE[1]/8: centery = PLAYSIZE[1]/8
-            elif centery > PLAYSIZE[1]-PLAYSIZE[1]/8: centery = PLAYSIZE[1]-PLAYSIZE[1]/8
-        elif self.zoom == 2.0:
-            if centerx < PLAYSIZE[0]/4: centerx = PLAYSIZE[0]/4
-            elif centerx > PLAYSIZE[0]-PLAYSIZE[0]/4: centerx = PLAYSIZE[0]-PLAYSIZE[0]/4
-            if centery < PLAYSIZE[1]/4: centery = PLAYSIZE[1]/4
-            elif centery > PLAYSIZE[1]-PLAYSIZE[1]/4: centery = PLAYSIZE[1]-PLAYSIZE[1]/4
+        """The middle of the tracked ships is the center of the screen unless
+        it is near an edge of the arena."""
+        centerx,centery = self.center
+        if self.zoom != self.zooms[-1]:
+            half_x,half_y = PLAYSIZE[0]*self.zoom/8,PLAYSIZE[1]*self.zoom/8
+            if centerx < half_x: centerx = half_x
+            elif centerx > ARENA[0]-half_x: centerx = ARENA[0]-half_x
+            if centery < half_y: centery = half_y
+            elif centery > ARENA[1]-half_y: centery = ARENA[1]-half_y
         self.center = centerx,centery
 
+    def fits(self,zoom,margin=0.0):
+        """Whether the tracked ships, with margin around them, fit in view at zoom."""
+        return (self.max_x+2*margin <= PLAYSIZE[0]*zoom/4 and
+                self.max_y+2*margin <= PLAYSIZE[1]*zoom/4)
+
     def get_zoom(self):
-        """Finds the required zoom based on how far apart players are."""
-        if self.max_x > PLAYSIZE[0]/2 or self.max_y > PLAYSIZE[1]/2:
-            self.zoom = 4.0
-        elif self.max_x > PLAYSIZE[0]/4 or self.max_y > PLAYSIZE[1]/4:
-            self.zoom = 2.0
-        else:
-            self.zoom = 1.0
-        if 5 in (self.P1.dead_frame,self.P2.dead_frame) and not (self.P1.dead,self.P2.dead) == (True,True):
-            self.zoom = 1.0
-        self.get_center()
+        """Finds the required zoom based on how far apart players are; the
+        closest zoom whose sector is wide enough to hold them all.  The
+        smooth camera leaves a margin, zooms out at once but in a level at a
+        time, and only once the level in would still leave twice the margin,
+        so it doesn't flicker between two levels.  Once one ship is left the
+        camera closes in on it."""
+        for zoom in self.zooms:
+            if self.fits(zoom,MARGIN if self.smooth else 0.0):
+                break
+        if self.smooth and zoom < self.zoom:
+            level = self.zooms.index(self.zoom)
+            if level and self.fits(self.zooms[level-1],2*MARGIN):
+                zoom = self.zooms[level-1]
+            else:
+                zoom = self.zoom
+        self.zoom = zoom
+        live = [Player for Player in self.Players if not Player.dead]
+        if len(live) == 1 and all(Player.dead_frame == 5 for Player in self.Players
+                                  if Player is not live[0]):
+            self.zoom = self.zooms[0]
 
     def get_extra(self):
         """Finds extra sliver offset if necessary. Hackish garbage."""
-        if self.zoom == 1.0:
-            self.extra = -int(math.modf(self.center[0])[0]*4),-int(math.modf(self.center[1])[0]*4)
-        elif self.zoom == 2.0:
-            self.extra = -int(math.modf(self.center[0])[0]*2),-int(math.modf(self.center[1])[0]*2)
+        scale = 4.0/self.zoom
+        if scale > 1:
+            self.extra = -int(math.modf(self.center[0])[0]*scale),-int(math.modf(self.center[1])[0]*scale)
         else:
             self.extra = (0,0)
 
     def get_bg_sector(self):
-        """Finds the section of our background image to use."""
-        if self.zoom == 4.0:
-            self.rect = pg.Rect((0,0),PLAYSIZE)
-        elif self.zoom == 2.0:
-            self.rect = pg.Rect(self.center[0]-PLAYSIZE[0]/4,self.center[1]-PLAYSIZE[1]/4,
-                                PLAYSIZE[0]/2,PLAYSIZE[1]/2)
+        """Finds the section of the world in view."""
+        if self.zoom == self.zooms[-1]:
+            self.rect = pg.Rect((0,0),ARENA)
         else:
-            self.rect = pg.Rect(self.center[0]-PLAYSIZE[0]/8,self.center[1]-PLAYSIZE[1]/8,
-                                PLAYSIZE[0]/4,PLAYSIZE[1]/4)
-        self.sector = self.bg.subsurface(self.rect)
+            width,height = PLAYSIZE[0]*self.zoom/4,PLAYSIZE[1]*self.zoom/4
+            self.rect = pg.Rect(self.center[0]-width/2,self.center[1]-height/2,width,height)
 
     def update(self):
         """Update function for the map called once per frame."""
         self.get_distance()
         self.get_zoom()
+        self.place()
+
+    def place(self):
+        """Point the camera at the ships at the current zoom and set every
+        object's zoom and screen position to match."""
+        self.get_center()
         self.get_bg_sector()
         self.get_extra()
         for thing in self.collide_objects:
             thing.change_zoom(self.zoom,self.rect,self.extra)
 
+    def glide(self,before,alpha):
+        """Move the view alpha (0 to 1) of the way from before, the camera's
+        (center,zoom) a tick earlier, to where it is now.  Zoom changes and
+        jumps of over half a view (a ship wrapped) are not blended.  Only the
+        view moves, so put center, rect and extra back after drawing."""
+        center,zoom = before
+        dx,dy = self.center[0]-center[0],self.center[1]-center[1]
+        if zoom == self.zoom and abs(dx) < PLAYSIZE[0]*zoom/8 and abs(dy) < PLAYSIZE[1]*zoom/8:
+            self.center = center[0]+dx*alpha,center[1]+dy*alpha
+            self.get_bg_sector()
+            self.get_extra()
+
+    def get_area(self):
+        """The part of the background image at the current zoom in view."""
+        scale = 4.0/self.zoom
+        area = pg.Rect(int(self.rect.x*scale)-self.extra[0],int(self.rect.y*scale)-self.extra[1],
+                       PLAYSIZE[0],PLAYSIZE[1])
+        return area.clamp(pg.Rect((0,0),self.tiles.size(self.zoom)))
+
     def draw_bg(self):
-        """Draws our map background to the surface; scaling when necessary."""
-        #The business with the extra pixels and slivers is a bit hackish but fine for now I suppose.
-        #This necessity is mandated by the fact that to scroll smoothly the background needs to move
-        #fractions of pixels relative to the original zoomed out image.
-        if self.zoom == 1.0:
-            temp = pg.transform.scale(self.sector,PLAYSIZE)
-            SURFACE.blit(temp,(OFFSET[0]+self.extra[0],OFFSET[1]+self.extra[1]))
-            if self.extra[0]:
-                try:
-                    sliv_rect_v = (self.rect.x+PLAYSIZE[0]/4,self.rect.y,1,PLAYSIZE[1]/4+1)
-                    sliverv = pg.transform.scale(self.bg.subsurface(sliv_rect_v),(4,PLAYSIZE[1]+4))
-                except ValueError:
-                    sliv_rect_v = (self.rect.x+PLAYSIZE[0]/4,self.rect.y,1,PLAYSIZE[1]/4)
-                    sliverv = pg.transform.scale(self.bg.subsurface(sliv_rect_v),(4,PLAYSIZE[1]))
-                SURFACE.blit(sliverv,(OFFSET[0]+PLAYSIZE[0]+self.extra[0],OFFSET[1]+self.extra[1]))
-            if self.extra[1]:
-                try:
-                    sliv_rect_h = (self.rect.x,self.rect.y+PLAYSIZE[1]/4,PLAYSIZE[0]/4+1,1)
-                    sliverh = pg.transform.scale(self.bg.subsurface(sliv_rect_h),(PLAYSIZE[0]+4,4))
-                except ValueError:
-                    sliv_rect_h = (self.rect.x,self.rect.y+PLAYSIZE[1]/4,PLAYSIZE[0]/4,1)
-                    sliverh = pg.transform.scale(self.bg.subsurface(sliv_rect_h),(PLAYSIZE[0],4))
-                SURFACE.blit(sliverh,(OFFSET[0]+self.extra[0],OFFSET[1]+PLAYSIZE[1]+self.extra[1]))
-        elif self.zoom == 2.0:
-            temp = pg.transform.scale(self.sector,PLAYSIZE)
-            SURFACE.blit(temp,(OFFSET[0]+self.extra[0],OFFSET[1]+self.extra[1]))
-            if self.extra[0]:
-                try:
-                    sliv_rect_v = (self.rect.x+PLAYSIZE[0]/2,self.rect.y,1,PLAYSIZE[1]/2+1)
-                    sliverv = pg.transform.scale(self.bg.subsurface(sliv_rect_v),(2,PLAYSIZE[1]+2))
-                except ValueError:
-                    sliv_rect_v = (self.rect.x+PLAYSIZE[0]/2,self.rect.y,1,PLAYSIZE[1]/2)
-                    sliverv = pg.transform.scale(self.bg.subsurface(sliv_rect_v),(2,PLAYSIZE[1]))
-                SURFACE.blit(sliverv,(OFFSET[0]+PLAYSIZE[0]+self.extra[0],OFFSET[1]+self.extra[1]))
-            if self.extra[1]:
-                try:
-                    sliv_rect_h = (self.rect.x,self.rect.y+PLAYSIZE[1]/2,PLAYSIZE[0]/2+1,1)
-                    sliverh = pg.transform.scale(self.bg.subsurface(sliv_rect_h),(PLAYSIZE[0]+2,2))
-                except ValueError:
-                    sliv_rect_h = (self.rect.x,self.rect.y+PLAYSIZE[1]/2,PLAYSIZE[0]/2,1)
-                    sliverh = pg.transform.scale(self.bg.subsurface(sliv_rect_h),(PLAYSIZE[0],2))
-                SURFACE.blit(sliverh,(OFFSET[0]+self.extra[0],OFFSET[1]+PLAYSIZE[1]+self.extra[1]))
+        """Draws our map background to the surface.  The visible sector is cut
+        straight out of the background tiles for the current zoom.  To scroll
+        smoothly the background must move fractions of a pixel relative to the
+        zoomed out image, which is done by shifting the cut by the extra pixels.
+        If the camera hasn't moved, only the areas drawn over last frame are
+        restored, from a copy of the view made the first time it is needed;
+        otherwise the whole view is redrawn and the screen invalidated.
+        Tiles the camera is heading for are then made ahead of time."""
+        area = self.get_area()
+        if DIRTY.full or area != self.view:
+            self.tiles.blits(SURFACE,[(OFFSET,area)],self.zoom)
+            DIRTY.invalidate()
+            self.view = area
         else:
-            SURFACE.blit(self.sector,OFFSET)
\ No newline at end of file
+            if self.backdrop_view != area:
+                if not self.backdrop:
+                    #Same format and colorkey as the background; SDL blits it fastest.
+                    self.backdrop = pg.Surface(PLAYSIZE,0,self.bg)
+                    self.backdrop.set_colorkey(self.bg.get_colorkey())
+                self.backdrop.fill(self.bg.get_colorkey() or (0,0,0))
+                self.tiles.blits(self.backdrop,[((0,0),area)],self.zoom)
+                self.backdrop_view = area
+            play = pg.Rect(OFFSET,PLAYSIZE)
+            jobs = []
+            for rect in DIRTY.last:
+                rect = play.clip(rect)
+                if rect.width and rect.height:
+                    jobs.append((self.backdrop,rect,rect.move(-OFFSET[0],-OFFSET[1])))
+            for rect in SURFACE.blits(jobs):
+                DIRTY.add(rect,False)
+        self.tiles.prefetch(area,self.zoom,self.zooms)
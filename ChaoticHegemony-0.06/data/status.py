@@ -1,6 +1,7 @@
 """Module: status.py
 Overview: Controls the updating of the stat bar during fights.
-Classes: Statbar"""
+Classes: Statbar
+Functions: get_back(flipped), get_gauge(size,stat,color), get_light(spot,index,blink,flipped)"""
 
 import pygame as pg
 
@@ -14,38 +15,58 @@ BLUE   = (0,100,255)
 
 COLORS = (GREEN,YELLOW,ORANGE,RED,BLUE)
 
+COLOR_INDEX = {color:index for index,color in enumerate(COLORS)}
+
 class Statbar:
-    def __init__(self,Player):
+    """A retained stat panel.  The panel image is only recomposited when life,
+    energy, or the blink phase actually change, out of gauges and indicator
+    lights that are rendered once and shared.  A flipped panel (for the left
+    side of the screen) is built from pre-flipped parts.  Panels shorter than
+    the screen, for stacking several on a side, show the top of the panel."""
+    def __init__(self,Player,location=(900,0),flipped=False,height=600):
         self.myplay = Player
-        self.image = pg.Surface((100,600)).convert()
+        self.flipped = flipped
+        self.rect = pg.Rect(location,(100,height)) #Location on the screen.
+        self.image = prepare(pg.Surface((100,height)))
+        self.back = get_back(flipped)
         self.l_color = GREEN
         self.e_color = GREEN
         l_height = 4+self.myplay.max_life*4
         e_height = 4+self.myplay.max_energy*4
-        self.L_rect = pg.Rect(13,101-l_height,34,l_height)
-        self.E_rect = pg.Rect(53,101-e_height,34,e_height)
+        self.L_rect = self.place(pg.Rect(13,101-l_height,34,l_height))
+        self.E_rect = self.place(pg.Rect(53,101-e_height,34,e_height))
+        self.L_light = self.place(pg.Rect(16,9,28,21))
+        self.E_light = self.place(pg.Rect(56,9,28,21))
         self.blink = False
         self.blink_time = 0.0
+        self.state = None #What the panel image currently shows.
+
+    def place(self,rect):
+        """Mirror a rect within the panel if it is flipped."""
+        if self.flipped:
+            rect = rect.copy()
+            rect.right = 100-rect.x
+        return rect
 
     def update(self):
-        """Update statbar image."""
-        self.l_color = self.get_color(self.myplay.life,self.myplay.max_life)
-        self.e_color = self.get_color(self.myplay.energy,self.myplay.max_energy)
+        """Update statbar image.  Returns True if the image changed."""
+        life,energy = self.myplay.life,self.myplay.energy
+        self.l_color = self.get_color(life,self.myplay.max_life)
+        self.e_color = self.get_color(energy,self.myplay.max_energy)
         self.blink_it()
-        energy = self.paint_stat(self.E_rect,self.myplay.energy,BLUE)
-        life   = self.paint_stat(self.L_rect,self.myplay.life,self.l_color)
-        self.image.blit(GFX["statbar"],(0,0))
-        self.image.blit(energy,self.E_rect)
-        self.image.blit(life,self.L_rect)
-        self.ind_lights()
-
-    def paint_stat(self,rect,stat,color):
-        """Prepare the stat display (life/energy)."""
-        surf = pg.Surface(rect.size)
-        surf.fill((0))
-        for point in range(int(stat)):
-            surf.fill(color,(4,rect.height-5-4*point,26,2))
-        return surf
+        l_ind = COLOR_INDEX[self.l_color]
+        e_ind = COLOR_INDEX[self.e_color]
+        if e_ind == 0: e_ind = 4
+        state = (max(int(life),0),max(int(energy),0),l_ind,e_ind,self.blink)
+        if state == self.state:
+            return False
+        self.state = state
+        self.image.blit(self.back,(0,0))
+        self.image.blit(get_gauge(self.E_rect.size,state[1],BLUE),self.E_rect)
+        self.image.blit(get_gauge(self.L_rect.size,state[0],self.l_color),self.L_rect)
+        self.image.blit(get_light(self.L_light.topleft,l_ind,self.blink,self.flipped),self.L_light)
+        self.image.blit(get_light(self.E_light.topleft,e_ind,self.blink,self.flipped),self.E_light)
+        return True
 
     def get_color(self,stat,maxy):
         """Change color based on percent of max stat."""
@@ -61,23 +82,45 @@ class Statbar:
 
     def blink_it(self):
         """Timer for indicator lights."""
-        if pg.time.get_ticks() - self.blink_time > 1000/3.0:
+        if self.myplay.clock.get_ticks() - self.blink_time > 1000/3.0:
             self.blink = False if self.blink else True
-            self.blink_time = pg.time.get_ticks()
-
-    def ind_lights(self):
-        """Flashing indicator lights."""
-        self.blink_it()
-        l_ind = COLORS.index(self.l_color)
-        e_ind = COLORS.index(self.e_color)
-        if e_ind == 0: e_ind = 4
-        self.image.blit(GFXA["indicators"],(16,9),(0,21*l_ind,28,21))
-        self.image.blit(GFXA["indicators"],(56,9),(0,21*e_ind,28,21))
-        if self.blink:
-            self.image.blit(GFXA["indicators"],(16,9),(0,21*l_ind,28,21))
-            self.image.blit(GFXA["indicators"],(56,9),(0,21*e_ind,28,21))
-
+            self.blink_time = self.myplay.clock.get_ticks()
 
+################################################################################
+#Pre-rendered panel parts shared by all stat bars.
+BACKS  = {}
+GAUGES = {}
+LIGHTS = {}
 
+def get_back(flipped):
+    """The empty panel, optionally flipped."""
+    if flipped not in BACKS:
+        BACKS[flipped] = pg.transform.flip(GFX["statbar"],flipped,False)
+    return BACKS[flipped]
 
+def get_gauge(size,stat,color):
+    """A life/energy gauge showing stat points.  Gauges are symmetric so the
+    same image serves flipped panels."""
+    key = (size,stat,color)
+    if key not in GAUGES:
+        surf = prepare(pg.Surface(size))
+        surf.fill((0))
+        for point in range(stat):
+            surf.fill(color,(4,size[1]-5-4*point,26,2))
+        GAUGES[key] = surf
+    return GAUGES[key]
 
+def get_light(spot,index,blink,flipped):
+    """An indicator light already blended over the panel behind it at spot.
+    Lights are drawn twice while blinking to make them brighter."""
+    key = (spot,index,blink,flipped)
+    if key not in LIGHTS:
+        rect = pg.Rect(spot,(28,21))
+        light = get_back(flipped).subsurface(rect).copy()
+        indicator = GFXA["indicators"].subsurface((0,21*index,28,21))
+        if flipped:
+            indicator = pg.transform.flip(indicator,True,False)
+        for layer in range(2 if blink else 1):
+            light.blit(indicator,(0,0))
+        LIGHTS[key] = light
+    return LIGHTS[key]
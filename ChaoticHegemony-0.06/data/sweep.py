@@ -0,0 +1,71 @@
+"""Module: sweep.py
+Overview: Swept (continuous) collision tests.  Masks are normally only tested
+where things are at the end of a tick, so anything that moves further in a
+tick than its solid parts are thick can pass straight through something
+without the two ever overlapping at a tick's end; the faster things go, or
+the longer the ticks, the worse it gets.  contact searches the path instead.
+The bounding rects of the set bits of the two masks are swept along their
+relative motion to find the part of the tick in which they could touch, and
+the masks are tested at every pixel of the path through it, from the first
+moment they could touch, until they overlap.  A sprite's thinnest part can be
+a single pixel wide (a wing tip, an antialiased edge), so no longer step is
+safe.  Motion of a pixel or less has nothing between where a tick starts and
+ends to test.
+Functions: solid(mask), contact(mask,other,offset,motion)"""
+
+SOLIDS = {} #mask -> solid(mask); masks are shared through the sprite cache.
+
+def solid(mask):
+    """Bounding rect of mask's set bits, or None for an empty mask."""
+    try:
+        return SOLIDS[mask]
+    except KeyError:
+        rects = mask.get_bounding_rects()
+        if not rects:
+            return None
+        result = rects[0].unionall(rects[1:])
+        if len(SOLIDS) > 4096:
+            SOLIDS.clear()
+        SOLIDS[mask] = result
+        return result
+
+def contact(mask,other,offset,motion):
+    """Where other first overlaps mask during a tick in which it ended at
+    offset from mask, having moved by motion relative to it.  Returns the
+    offset of the first overlap found, or None, and the number of mask tests
+    made."""
+    mx,my = motion
+    length = max(abs(mx),abs(my))
+    if length <= 1:
+        return None,0
+    a,b = solid(mask),solid(other)
+    if not a or not b:
+        return None,0
+    #other's offset at time t (0 to 1) of the tick is start+t*motion.
+    start = offset[0]-mx,offset[1]-my
+    first,last = 0.0,1.0
+    for low,high,b_low,b_high,s,m in ((a.left,a.right,b.left,b.right,start[0],mx),
+                                      (a.top,a.bottom,b.top,b.bottom,start[1],my)):
+        #The solid rects overlap on this axis while b_low+s+t*m < high and
+        #b_high+s+t*m > low.
+        if not m:
+            if not (b_low+s < high and b_high+s > low):
+                return None,0
+            continue
+        enter,leave = (low-b_high-s)/float(m),(high-b_low-s)/float(m)
+        if enter > leave:
+            enter,leave = leave,enter
+        first,last = max(first,enter),min(last,leave)
+        if first > last:
+            return None,0
+    step = 1.0/length #One pixel along the longer axis of the motion.
+    tests = 0
+    t = first
+    while True:
+        spot = (int(round(start[0]+t*mx)),int(round(start[1]+t*my)))
+        tests += 1
+        if mask.overlap(other,spot):
+            return spot,tests
+        if t >= last:
+            return None,tests
+        t = min(t+step,last)
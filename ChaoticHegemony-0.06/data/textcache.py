@@ -0,0 +1,39 @@
+"""Module: textcache.py
+Overview: Cache of rendered text surfaces so the same strings aren't
+rasterized by the font every frame they are shown.
+Classes: TextCache
+Globals: TEXT"""
+
+import threading
+from collections import OrderedDict
+
+class TextCache:
+    """Rendered strings keyed by (font, text, color, antialias), evicted least
+    recently used first once max_size is exceeded.  Returned surfaces are
+    shared; never draw on them.  Lookups are locked, as for the sprite cache."""
+    def __init__(self,max_size=256):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self,font,text,color,antialias=True):
+        """Drop in replacement for font.render(text,antialias,color)."""
+        key = (font,text,tuple(color),bool(antialias))
+        with self.lock:
+            try:
+                image = self.entries[key]
+                self.entries.move_to_end(key)
+                self.hits += 1
+            except KeyError:
+                image = self.entries[key] = font.render(text,antialias,color)
+                self.misses += 1
+                if len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+        return image
+
+    def clear(self):
+        self.entries.clear()
+
+TEXT = TextCache()
@@ -0,0 +1,156 @@
+"""Module: tiles.py
+Overview: The fight background cut into tiles that are made on demand.  At
+each zoom level the background is a virtual image, ARENA*4/zoom pixels big,
+split into TILE sized squares.  A tile is made when first needed by scaling
+its part of the source image, and tiles are kept in a least recently used
+cache of fixed size.  Memory therefore stays bounded however big the arena
+is.  Arenas bigger than the source image repeat it, mirrored so the seams
+match.  Each frame a few tiles are made ahead of the camera, in the
+direction it is moving and at the neighbouring zoom levels, within a time
+budget.  Crossing into new tiles then finds them already made.
+Classes: TiledBackground
+Functions: get_background(image)
+Globals: TILE"""
+
+import math,time
+from collections import OrderedDict
+import pygame as pg
+
+from .globs import *
+
+TILE = 256 #Tile size in screen pixels at every zoom level.
+
+class TiledBackground:
+    """Tiles of one source image across the arena.  World pixels map one to
+    one onto the source, as they do at zoom 4; where the source is bigger than
+    the arena it still extends past it, so the edges look as they always have."""
+    def __init__(self,image,capacity=96,budget=1.0):
+        self.image = image
+        self.extent = (max(ARENA[0],image.get_width()),max(ARENA[1],image.get_height()))
+        self.capacity = capacity
+        self.budget = budget #Milliseconds a frame may spend making tiles ahead.
+        self.tiles = OrderedDict() #(zoom,col,row) -> Surface
+        self.last = None #(area,zoom) of the last prefetch.
+        self.hits = 0
+        self.misses = 0
+
+    def size(self,zoom):
+        """Size of the virtual background image at zoom."""
+        return (int(self.extent[0]*4/zoom),int(self.extent[1]*4/zoom))
+
+    def get(self,zoom,col,row):
+        key = (zoom,col,row)
+        try:
+            tile = self.tiles[key]
+            self.tiles.move_to_end(key)
+            self.hits += 1
+        except KeyError:
+            tile = self.tiles[key] = self.make(zoom,col,row)
+            self.misses += 1
+            if len(self.tiles) > self.capacity:
+                self.tiles.popitem(last=False)
+        return tile
+
+    def make(self,zoom,col,row):
+        """Scale one tile from its part of the source.  At zoom levels that
+        don't divide TILE evenly the tile's edges fall inside world pixels, so
+        the whole pixels around it are scaled and the tile cut from that."""
+        scale = 4.0/zoom
+        screen = pg.Rect(col*TILE,row*TILE,TILE,TILE).clip(pg.Rect((0,0),self.size(zoom)))
+        left,top = int(screen.x/scale),int(screen.y/scale)
+        world = pg.Rect(left,top,min(int(math.ceil(screen.right/scale)),self.extent[0])-left,
+                        min(int(math.ceil(screen.bottom/scale)),self.extent[1])-top)
+        source = self.source(world)
+        if zoom == 4.0:
+            return source.copy() #Blitting from a subsurface is slow.
+        cut = pg.Rect(int(round(screen.x-left*scale)),int(round(screen.y-top*scale)),
+                      screen.width,screen.height)
+        size = (max(int(round(world.width*scale)),cut.right),
+                max(int(round(world.height*scale)),cut.bottom))
+        if size == screen.size:
+            return pg.transform.scale(source,size)
+        return pg.transform.scale(source,size).subsurface(cut).copy()
+
+    def source(self,world):
+        """The part of the (mirror repeated) source image under world."""
+        W,H = self.image.get_size()
+        cells = [(x,y) for y in range(world.top//H,(world.bottom-1)//H+1)
+                       for x in range(world.left//W,(world.right-1)//W+1)]
+        if cells == [(0,0)]:
+            return self.image.subsurface(world)
+        surface = pg.Surface(world.size,0,self.image)
+        for x,y in cells:
+            cell = pg.Rect(x*W,y*H,W,H).clip(world)
+            local = cell.move(-x*W,-y*H)
+            if x%2:
+                local.x = W-local.right
+            if y%2:
+                local.y = H-local.bottom
+            piece = self.image.subsurface(local)
+            if x%2 or y%2:
+                piece = pg.transform.flip(piece,x%2,y%2)
+            surface.blit(piece,(cell.x-world.x,cell.y-world.y))
+        return surface
+
+    def keys(self,area,zoom):
+        """Keys of the tiles under area of the virtual image at zoom."""
+        area = area.clip(pg.Rect((0,0),self.size(zoom)))
+        return [(zoom,col,row) for row in range(area.top//TILE,(area.bottom-1)//TILE+1)
+                               for col in range(area.left//TILE,(area.right-1)//TILE+1)]
+
+    def blits(self,Surface,jobs,zoom):
+        """Like Surface.blits for (location,area) pairs, where area is part of
+        the virtual image at zoom.  Returns the rects drawn; an area that
+        crosses tiles is drawn, and returned, in parts."""
+        parts = []
+        used = {} #Tiles already looked up for this call.
+        for location,area in jobs:
+            x,y,w,h = area
+            col,row = x//TILE,y//TILE
+            if (x+w-1)//TILE == col and (y+h-1)//TILE == row:
+                tile = used.get((col,row))
+                if not tile:
+                    tile = used[col,row] = self.get(zoom,col,row)
+                parts.append((tile,location,(x-col*TILE,y-row*TILE,w,h)))
+                continue
+            for key in self.keys(area,zoom):
+                col,row = key[1:]
+                tile = self.get(*key)
+                part = tile.get_rect(topleft=(col*TILE,row*TILE)).clip(area)
+                parts.append((tile,(location[0]+part.x-area.x,location[1]+part.y-area.y),
+                              part.move(-col*TILE,-row*TILE)))
+        return Surface.blits(parts)
+
+    def prefetch(self,area,zoom,zooms=ZOOMS):
+        """Make tiles the camera is likely to need soon: the next row or
+        column of tiles in the direction it moved since the last call, then
+        the same view at the levels either side of zoom in zooms."""
+        last,self.last = self.last,(area,zoom)
+        wanted = []
+        if last and last[1] == zoom and last[0] != area:
+            dx,dy = area.x-last[0].x,area.y-last[0].y
+            ahead = area.move(TILE*((dx > 0)-(dx < 0)),TILE*((dy > 0)-(dy < 0)))
+            wanted.extend(self.keys(area.union(ahead),zoom))
+        i = zooms.index(zoom) if zoom in zooms else None
+        if i is not None:
+            center = (area.centerx*zoom/4,area.centery*zoom/4) #In world pixels.
+            for other in zooms[max(i-1,0):i]+zooms[i+1:i+2]:
+                view = pg.Rect(0,0,area.width,area.height)
+                view.center = (center[0]*4/other,center[1]*4/other)
+                view.clamp_ip(pg.Rect((0,0),self.size(other)))
+                wanted.extend(self.keys(view,other))
+        deadline = time.perf_counter()+self.budget/1000.0
+        for key in wanted:
+            if key in self.tiles:
+                self.tiles.move_to_end(key) #Keep wanted tiles from being evicted.
+            elif time.perf_counter() < deadline:
+                self.get(*key)
+
+################################################################################
+def get_background(image):
+    """The tiled background for an image, shared by every StarMap."""
+    if image not in BACKGROUNDS:
+        BACKGROUNDS[image] = TiledBackground(image)
+    return BACKGROUNDS[image]
+
+BACKGROUNDS = {}
@@ -5,33 +5,57 @@ Classes: Title"""
 import math,random
 import pygame as pg
 
-from . import bodies,starmap
+from . import bodies,simclock,starmap
 from .globs import *
+from .profiler import PROFILE
+from .render import DIRTY
+from .textcache import TEXT
 
 class Title:
     def __init__(self):
         self.offset = (-250,-150)
         self.choord = [0,0]
-        self.back = pg.transform.scale(GFX["myneb1"],(1500,900))
+        self.back = GFX.scaled("myneb1",(1500,900))
         self.fore = GFXA["titlepic"]
         self.circ = 0.0
         self.timer = 0.0
+        self.clock = simclock.SimClock()
         self.blink = False
         self.done = False
-        self.image = pg.Surface((1000,600)).convert_alpha()
+        self.image = prepare(pg.Surface((1000,600)),True)
 
         self.Shipu = None
         self.Shipb = None
 
+    def reset(self):
+        """Start the title over, keeping the scaled background and surfaces."""
+        self.choord = [0,0]
+        self.circ = 0.0
+        self.timer = 0.0
+        self.clock.reset()
+        self.blink = False
+        self.done = False
+        self.Shipu = None
+        self.Shipb = None
+
     def title_event(self,event):
         """Press any key to continue."""
         if event.type == pg.KEYDOWN:
             self.done = True
 
     def update(self,Surf):
-        """Draw everything in its time in its place."""
+        """Draw everything in its time in its place.  If Surf is None the
+        animation advances a tick without drawing."""
+        start = PROFILE.now()
+        self.clock.tick()
         self.get_choords()
         self.fly_by()
+        if self.clock.get_ticks() - self.timer > 1000/5.0:
+            self.blink = False if self.blink else True
+            self.timer = self.clock.get_ticks()
+        start = PROFILE.lap("title.animate",start)
+        if not Surf:
+            return
         targ = (self.offset[0]+self.choord[0],self.offset[1]+self.choord[1])
         self.image.blit(self.back,targ)
         self.image.blit(self.fore,(0,0))
@@ -39,12 +63,11 @@ class Title:
             self.image.blit(self.Shipu.image,self.Shipu.location)
         if self.Shipb:
             self.image.blit(self.Shipb.image,self.Shipb.location)
-        if pg.time.get_ticks() - self.timer > 1000/5.0:
-            self.blink = False if self.blink else True
-            self.timer = pg.time.get_ticks()
         if self.blink:
-            self.image.blit(fixedsys.render("-PRESS ANY KEY-",1,(255,255,0)),(475,485))
+            self.image.blit(TEXT.render(fixedsys,"-PRESS ANY KEY-",(255,255,0)),(475,485))
         Surf.blit(self.image,(0,0))
+        DIRTY.invalidate() #The whole title screen animates.
+        PROFILE.lap("title.draw",start)
 
     def get_choords(self):
         """Get coordinates for the starscape in the background."""